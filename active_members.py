@@ -0,0 +1,69 @@
+import os
+import time
+import logging
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+class ActiveMembers:
+    """Aktif üyelerin bitiş zamanlarını bellekte tutar; üyelik kontrolü O(1) ve diske gitmeden yapılır.
+
+    Başlangıçta members tablosundan doldurulur, add_member ve üyelik sonlandırma
+    ile güncel tutulur. Başka süreçlerde yapılan değişiklikler periyodik olarak
+    yeniden yüklenir.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._expiries = {}  # user_id -> expire_date
+        self._changes = None  # Yükleme sürerken yapılan değişiklikler, yükleme sonrası uygulanır
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def __contains__(self, user_id: int):
+        expire_at = self._expiries.get(user_id)
+        return expire_at is not None and expire_at > time.time()
+
+    def add(self, user_id: int, expire_at: int):
+        """Üyeliği ekle veya bitiş zamanını güncelle"""
+        self._expiries[user_id] = expire_at
+        if self._changes is not None:
+            self._changes.append((user_id, expire_at))
+
+    def discard(self, user_ids):
+        """Sonlandırılan üyelikleri çıkar"""
+        for user_id in user_ids:
+            self._expiries.pop(user_id, None)
+            if self._changes is not None:
+                self._changes.append((user_id, None))
+
+    async def load(self):
+        """Aktif üyeleri veritabanından yükle"""
+        self._changes = []
+        try:
+            expiries = dict(await self.db.get_active_members())
+            for user_id, expire_at in self._changes:
+                if expire_at is None:
+                    expiries.pop(user_id, None)
+                else:
+                    expiries[user_id] = expire_at
+            self._expiries = expiries
+        finally:
+            self._changes = None
+        logger.info(f"{len(self._expiries)} aktif üye belleğe yüklendi")
+
+    def start(self, job_queue):
+        """Başka süreçlerdeki değişiklikleri almak için periyodik yeniden yüklemeyi başlat"""
+        job_queue.run_repeating(
+            self.resync,
+            interval=timedelta(seconds=int(os.getenv('ACTIVE_MEMBERS_RESYNC_SECONDS', 300))),
+            first=timedelta(seconds=int(os.getenv('ACTIVE_MEMBERS_RESYNC_SECONDS', 300)))
+        )
+
+    async def resync(self, context) -> None:
+        """Aktif üyeleri yeniden yükle (job queue callback'i)"""
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error(f"Aktif üyeler yüklenemedi: {str(e)}")
@@ -0,0 +1,51 @@
+import os
+import time
+import tempfile
+import logging
+from database import Database
+
+logging.disable(logging.CRITICAL)
+
+OPERATIONS = int(os.getenv('BENCH_OPERATIONS', 2000))
+
+def run(db: Database, label: str) -> dict:
+    """Temel işlemleri çalıştır ve saniyedeki işlem sayısını ölç"""
+    results = {}
+    
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.add_payment(f"{label}-{i}", i, 30.0)
+    results['add_payment'] = OPERATIONS / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.get_payment(f"{label}-{i}")
+    results['get_payment'] = OPERATIONS / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.update_subscription(i, f"user{i}", 30)
+    results['update_subscription'] = OPERATIONS / (time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        db.get_user(i)
+    results['get_user'] = OPERATIONS / (time.perf_counter() - start)
+    
+    return results
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        per_call = run(Database(os.path.join(tmp, 'per_call.db')), 'per_call')
+        persistent_db = Database(os.path.join(tmp, 'persistent.db'), persistent=True)
+        persistent = run(persistent_db, 'persistent')
+        persistent_db.close()
+    
+    print(f"{OPERATIONS} işlem / ölçüm")
+    print(f"{'İşlem':<22}{'Her çağrıda bağlantı':>22}{'Kalıcı bağlantı':>18}{'Kazanç':>10}")
+    for name in per_call:
+        print(f"{name:<22}{per_call[name]:>18.0f} op/s{persistent[name]:>14.0f} op/s"
+              f"{persistent[name] / per_call[name]:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
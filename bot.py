@@ -2,12 +2,29 @@ import os
 import logging
 from datetime import datetime, timedelta
 import asyncio
+import time
+import csv
+import io
+import re
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, JobQueue, MessageHandler, filters
-from payment_processor import NowPaymentsProcessor
+from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler, ChatJoinRequestHandler, JobQueue, MessageHandler, filters
+from payment_processor import NowPaymentsProcessor, PAID_STATUSES, TERMINAL_STATUSES, OPEN_STATUSES
+from database import Database, AsyncDatabase
+from ipn_server import IPNServer
+from message_dispatcher import MessageDispatcher, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK
+from telegram.error import BadRequest
+from payment_poller import PaymentPoller
+from expiry_scheduler import ExpiryScheduler
+from expiry_pipeline import ExpiryPipeline, NOTIFY_REVOKED
+from invoice_cache import InvoiceCache
+from invite_pool import InvitePool
+from active_members import ActiveMembers
+from update_processor import ChatOrderedUpdateProcessor
+from persistence import SQLitePersistence
+from reconciliation import PaymentReconciler, PaymentListReconciler
+from receipt_queue import ReceiptQueue
 import html
-import sqlite3
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 # Loglama ayarları
@@ -20,6 +37,23 @@ load_dotenv()
 
 # Global değişkenler
 payment_processor = NowPaymentsProcessor()
+db = AsyncDatabase(Database)
+# Kullanıcı başına açık fatura indeksi (tekrar basışlarda aynı fatura gösterilir)
+invoice_cache = InvoiceCache(payment_processor, db)
+# Gruba katılma isteklerini diske gitmeden yanıtlamak için aktif üyeler
+active_members = ActiveMembers(db)
+# Onaylanan ödemelere verilen tek kullanımlık davet bağlantıları
+invite_pool = InvitePool(db)
+# Tüm giden mesajlar hız sınırlarına uyan tek kuyruktan gönderilir
+dispatcher = MessageDispatcher()
+# Banka havalesi dekontları kuyrukta tutulur, admin'e periyodik özet gider
+receipt_queue = ReceiptQueue(db, dispatcher)
+
+# Toplu admin komutlarında tek seferde işlenebilecek en fazla kullanıcı
+BULK_MAX_USERS = int(os.getenv('BULK_MAX_USERS', 5000))
+
+# Eski sürümlerin ayrı tuttuğu üyelik veritabanı (ilk açılışta içe aktarılır)
+LEGACY_MEMBERS_DB = 'members.db'
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Bot başlatıldığında çalışacak komut"""
@@ -119,41 +153,39 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         context.user_data['waiting_for_receipt'] = True
 
 async def check_payment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    args = context.args
-    
-    if not args:
-        await update.message.reply_text(
-            "❌ Lütfen ödeme ID'nizi girin.\n"
-            "Örnek: /check_payment <payment_id>"
-        )
-        return
+    """Ödeme durumunu /check_payment komutu veya Kontrol butonu ile sorgula"""
+    query = update.callback_query
+    if query:
+        await query.answer()
+        payment_id = query.data.split('_', 1)[1]
+        reply_text = query.message.reply_text
+    else:
+        if not context.args:
+            await update.message.reply_text(
+                "❌ Lütfen ödeme ID'nizi girin.\n"
+                "Örnek: /check_payment <payment_id>"
+            )
+            return
+        payment_id = context.args[0]
+        reply_text = update.message.reply_text
     
-    payment_id = args[0]
+    # Sık basılan butonlar önbellekten ve paylaşılan tek sorgudan yanıtlanır
     result = await payment_processor.check_payment(payment_id)
     
-    if result['success'] and result['paid']:
-        user_id = update.effective_user.id
-        
+    if result['success'] and result['paid'] and await db.get_payment(payment_id):
         try:
-            # Kullanıcıyı veritabanına ekle
-            add_member(user_id)
-            
-            await update.message.reply_text(
-                "✅ Ödemeniz onaylandı!\n\n"
-                "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
-                f"{os.getenv('TELEGRAM_GROUP_INVITE_LINK')}\n\n"
-                "⚠️ Üyeliğiniz 30 gün boyunca aktif kalacaktır.\n"
-                "📅 Süre sonunda otomatik olarak gruptan çıkarılacaksınız."
-            )
+            # Üyelik yalnızca ilk onayda verilir, davet bağlantısı ödeme sahibine gönderilir
+            if not await confirm_payment(context.bot, payment_id, result['status']):
+                await reply_text("✅ Ödemeniz daha önce onaylandı.")
             
         except Exception as e:
             logging.error(f"Üye ekleme hatası: {str(e)}")
-            await update.message.reply_text(
+            await reply_text(
                 "✅ Ödemeniz onaylandı fakat bir hata oluştu.\n"
                 "Lütfen yönetici ile iletişime geçin."
             )
     else:
-        await update.message.reply_text(
+        await reply_text(
             "❌ Ödeme bulunamadı veya henüz onaylanmadı.\n"
             "Lütfen birkaç dakika bekleyip tekrar deneyin."
         )
@@ -163,11 +195,21 @@ async def create_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
         await query.answer()  # Önce callback'i yanıtlayalım
         
-        payment_processor = NowPaymentsProcessor()
-        result = await payment_processor.create_payment(float(os.getenv('MINIMUM_PAYMENT_USD')))
+        # Aynı kullanıcının açık faturası varsa yenisi oluşturulmaz
+        result = await invoice_cache.get_or_create(
+            update.effective_user.id,
+            float(os.getenv('MINIMUM_PAYMENT_USD'))
+        )
         
         if result and result.get('success'):
-            text = f"Adres: {result['wallet_address']}\nMiktar: {result['amount_btc']} BTC"
+            if not result['reused']:
+                # IPN gecikirse diye arka planda durumunu takip et
+                payment_poller.track(str(result['payment_id']))
+            expires_at = datetime.fromtimestamp(result['expires_at_ts'])
+            text = (
+                f"Adres: {result['wallet_address']}\nMiktar: {result['amount_btc']} BTC\n"
+                f"Son geçerlilik: {expires_at.strftime('%H:%M')}"
+            )
             
             keyboard = [[
                 InlineKeyboardButton(
@@ -185,9 +227,10 @@ async def create_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
             except Exception as msg_error:
                 logging.error(f"Mesaj gönderme hatası: {msg_error}")
                 # Alternatif mesaj gönderme denemesi
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id,
-                    text=text,
+                await dispatcher.send_message(
+                    update.effective_chat.id,
+                    text,
+                    PRIORITY_HIGH,
                     reply_markup=InlineKeyboardMarkup(keyboard)
                 )
         else:
@@ -255,12 +298,13 @@ async def test_check_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         
         try:
             # Kullanıcıyı veritabanına ekle
-            add_member(user_id)
+            await add_member(user_id)
+            invite_link = await invite_pool.take(context.bot, user_id)
             
             await query.message.reply_text(
                 "✅ Test başarılı!\n\n"
                 "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
-                f"{os.getenv('TELEGRAM_GROUP_INVITE_LINK')}\n\n"
+                f"{invite_link}\n\n"
                 "⚠️ Üyeliğiniz 30 gün boyunca aktif kalacaktır.\n"
                 "📅 Süre sonunda otomatik olarak gruptan çıkarılacaksınız."
             )
@@ -283,119 +327,63 @@ async def test_check_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
 # Mesaj gönderme fonksiyonunu güvenli hale getirme
-def send_safe_message(bot, chat_id, text):
+async def send_safe_message(chat_id, text: str, priority: int = PRIORITY_NORMAL, **kwargs):
+    """Mesajı merkezi gönderici üzerinden gönder"""
     try:
         # HTML parse_mode kullanarak ve karakterleri escape ederek gönder
-        escaped_text = html.escape(text)
-        return bot.send_message(
-            chat_id=chat_id,
-            text=escaped_text,
-            parse_mode='HTML'
-        )
-    except Exception as e:
-        # Hata durumunda parse_mode olmadan tekrar dene
-        return bot.send_message(
-            chat_id=chat_id,
-            text=text
+        return await dispatcher.send_message(
+            chat_id, html.escape(text), priority, parse_mode='HTML', **kwargs
         )
+    except BadRequest:
+        # Biçim hatası durumunda parse_mode olmadan tekrar dene
+        return await dispatcher.send_message(chat_id, text, priority, **kwargs)
 
 # Veritabanı işlemleri için yardımcı fonksiyonlar
-def init_db():
-    """Veritabanını oluştur"""
-    conn = sqlite3.connect('members.db')
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS members (
-            user_id INTEGER PRIMARY KEY,
-            join_date TEXT,
-            expire_date TEXT,
-            is_active INTEGER
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def add_member(user_id: int):
+async def add_member(user_id: int):
     """Yeni üye ekle"""
-    conn = sqlite3.connect('members.db')
-    c = conn.cursor()
-    
-    join_date = datetime.now()
-    expire_date = join_date + timedelta(days=30)
-    
-    c.execute('''
-        INSERT OR REPLACE INTO members (user_id, join_date, expire_date, is_active)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, join_date.isoformat(), expire_date.isoformat(), 1))
-    
-    conn.commit()
-    conn.close()
+    expire_at = await db.add_member(user_id)
+    active_members.add(user_id, expire_at)
+    expiry_scheduler.schedule(user_id, expire_at)
 
-async def check_expired_members(context: ContextTypes.DEFAULT_TYPE):
+# Süresi dolan üyelikleri toplu sonlandıran işlem hattı ve bitiş anına yakın tetiklenen zamanlayıcı
+expiry_pipeline = ExpiryPipeline(db, dispatcher=dispatcher, on_expired=active_members.discard)
+expiry_scheduler = ExpiryScheduler(db, expiry_pipeline.expire)
+
+async def check_expired_members(context: ContextTypes.DEFAULT_TYPE) -> dict:
     """Süresi dolan üyelikleri kontrol et"""
     try:
-        conn = sqlite3.connect('members.db')
-        c = conn.cursor()
-        
-        now = datetime.now()
-        
         # Süresi dolan aktif üyeleri bul
-        c.execute('''
-            SELECT user_id FROM members 
-            WHERE expire_date < ? AND is_active = 1
-        ''', (now.isoformat(),))
-        
-        expired_members = c.fetchall()
-        
-        for member in expired_members:
-            user_id = member[0]
-            try:
-                # Veritabanında pasif yap
-                c.execute('''
-                    UPDATE members SET is_active = 0
-                    WHERE user_id = ?
-                ''', (user_id,))
-                
-                # Kullanıcıya bildirim gönder
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text="⚠️ VIP üyelik süreniz dolmuştur. Yenilemek için /start komutunu kullanabilirsiniz."
-                    )
-                except:
-                    logging.warning(f"Kullanıcıya mesaj gönderilemedi: {user_id}")
-                
-                logging.info(f"Üyelik süresi dolan kullanıcı pasif yapıldı: {user_id}")
-                
-            except Exception as e:
-                logging.error(f"Üye işlemi hatası - User ID: {user_id}, Hata: {str(e)}")
-        
-        conn.commit()
-        
+        expired_members = await db.get_expired_members()
+        return await expiry_pipeline.expire(context.bot, expired_members)
     except Exception as e:
         logging.error(f"Üyelik kontrolü hatası: {str(e)}")
-    finally:
-        conn.close()
+        return None
+
+async def check_expired_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için süresi dolan üyelikleri elle sonlandırma komutu"""
+    if str(update.effective_user.id) != os.getenv('ADMIN_ID'):
+        await update.message.reply_text("Bu komut sadece yöneticiler içindir.")
+        return
+    
+    summary = await check_expired_members(context)
+    if summary is None:
+        await update.message.reply_text("❌ Üyelik kontrolü sırasında bir hata oluştu.")
+        return
+    await update.message.reply_text(
+        f"✅ {summary['expired']} üyelik sonlandırıldı.\n"
+        f"🔁 Yeniden denenecek adım: {summary['failed']}"
+    )
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Üyelik durumunu kontrol et"""
     try:
         user_id = update.effective_user.id
-        conn = sqlite3.connect('members.db')
-        c = conn.cursor()
-        
-        c.execute('''
-            SELECT join_date, expire_date, is_active 
-            FROM members 
-            WHERE user_id = ?
-        ''', (user_id,))
-        
-        member = c.fetchone()
+        member = await db.get_member(user_id)
         
         if member:
-            join_date = datetime.fromisoformat(member[0])
-            expire_date = datetime.fromisoformat(member[1])
-            is_active = member[2]
+            join_date = datetime.fromtimestamp(member['join_date'])
+            expire_date = datetime.fromtimestamp(member['expire_date'])
+            is_active = member['is_active']
             
             remaining_days = (expire_date - datetime.now()).days
             
@@ -420,8 +408,6 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     except Exception as e:
         logging.error(f"Durum kontrolü hatası: {str(e)}")
         await update.message.reply_text("Durum kontrolü sırasında bir hata oluştu.")
-    finally:
-        conn.close()
 
 async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Admin için manuel ödeme onaylama komutu"""
@@ -442,19 +428,20 @@ async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user_id = int(args[0])
         
         # Kullanıcıyı veritabanına ekle
-        add_member(user_id)
+        await add_member(user_id)
+        await db.resolve_receipts([user_id], 'approved')
         
         # Kullanıcıya bildirim gönder
         try:
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=(
-                    "✅ Ödemeniz onaylandı!\n\n"
-                    "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
-                    f"{os.getenv('TELEGRAM_GROUP_INVITE_LINK')}\n\n"
-                    "⚠️ Üyeliğiniz 30 gün boyunca aktif kalacaktır.\n"
-                    "📅 Süre sonunda otomatik olarak gruptan çıkarılacaksınız."
-                )
+            invite_link = await invite_pool.take(context.bot, user_id)
+            await send_safe_message(
+                user_id,
+                "✅ Ödemeniz onaylandı!\n\n"
+                "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
+                f"{invite_link}\n\n"
+                "⚠️ Üyeliğiniz 30 gün boyunca aktif kalacaktır.\n"
+                "📅 Süre sonunda otomatik olarak gruptan çıkarılacaksınız.",
+                PRIORITY_HIGH
             )
             await update.message.reply_text(f"✅ Kullanıcı {user_id} başarıyla onaylandı.")
             
@@ -468,6 +455,149 @@ async def approve_payment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logging.error(f"Ödeme onaylama hatası: {str(e)}")
         await update.message.reply_text("❌ Onaylama sırasında bir hata oluştu.")
 
+async def read_bulk_targets(update: Update, context: ContextTypes.DEFAULT_TYPE, skip_args: int = 0) -> tuple:
+    """Komut argümanlarından ve yanıtlanan CSV dosyasından kullanıcı ID'lerini oku"""
+    tokens = list(context.args[skip_args:])
+    
+    # Yanıtlanan mesajdaki CSV dosyasının ilk sütunu kullanıcı ID'sidir
+    reply = update.message.reply_to_message
+    if reply and reply.document:
+        telegram_file = await context.bot.get_file(reply.document.file_id)
+        content = (await telegram_file.download_as_bytearray()).decode('utf-8-sig')
+        rows = [row for row in csv.reader(io.StringIO(content)) if row and row[0].strip()]
+        # Başlık satırı atlanır
+        if rows and not rows[0][0].strip().isdigit():
+            rows = rows[1:]
+        tokens.extend(row[0] for row in rows)
+    
+    user_ids = []
+    invalid = []
+    for token in tokens:
+        for part in re.split(r'[,;\s]+', token.strip()):
+            if part.isdigit():
+                user_ids.append(int(part))
+            elif part:
+                invalid.append(part)
+    return list(dict.fromkeys(user_ids)), invalid
+
+async def bulk_members(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str) -> None:
+    """Admin için toplu onaylama, uzatma veya iptal"""
+    if str(update.effective_user.id) != os.getenv('ADMIN_ID'):
+        await update.message.reply_text("Bu komut sadece yöneticiler içindir.")
+        return
+    
+    days = int(os.getenv('SUBSCRIPTION_DAYS', 30))
+    skip_args = 0
+    if action == 'extend':
+        if not context.args or not context.args[0].isdigit():
+            await update.message.reply_text(
+                "❌ Gün sayısı gerekli.\n"
+                "Örnek: /bulk_extend 30 123456789 987654321"
+            )
+            return
+        days = int(context.args[0])
+        skip_args = 1
+    
+    try:
+        user_ids, invalid = await read_bulk_targets(update, context, skip_args)
+    except Exception as e:
+        logging.error(f"Toplu işlem listesi okunamadı: {str(e)}")
+        await update.message.reply_text("❌ Kullanıcı listesi okunamadı.")
+        return
+    
+    if not user_ids:
+        await update.message.reply_text(
+            "❌ Kullanıcı ID'leri gerekli.\n"
+            "ID'leri komuttan sonra yazın veya bir CSV dosyasını bu komutla yanıtlayın.\n"
+            f"Örnek: /bulk_{action} 123456789 987654321"
+        )
+        return
+    if len(user_ids) > BULK_MAX_USERS:
+        await update.message.reply_text(f"❌ Tek seferde en fazla {BULK_MAX_USERS} kullanıcı işlenebilir.")
+        return
+    
+    # Tüm veritabanı değişiklikleri tek işlemde uygulanır
+    try:
+        if action == 'revoke':
+            revoked = await db.revoke_members(user_ids)
+            changed = [(user_id, None) for user_id in revoked]
+            active_members.discard(revoked)
+            for user_id in revoked:
+                expiry_scheduler.cancel(user_id)
+        else:
+            if action == 'approve':
+                changed = await db.bulk_add_members(user_ids, days)
+            else:
+                changed = await db.bulk_extend_members(user_ids, days)
+            for user_id, expire_at in changed:
+                active_members.add(user_id, expire_at)
+                expiry_scheduler.schedule(user_id, expire_at)
+    except Exception as e:
+        logging.error(f"Toplu işlem hatası: {str(e)}")
+        await update.message.reply_text("❌ Toplu işlem sırasında bir hata oluştu.")
+        return
+    
+    action_names = {'approve': 'Onaylama', 'extend': 'Uzatma', 'revoke': 'İptal'}
+    summary = (
+        f"📋 Toplu {action_names[action]} Tamamlandı\n\n"
+        f"İstenen: {len(user_ids)}\n"
+        f"Güncellenen: {len(changed)}"
+    )
+    if action == 'revoke' and len(changed) < len(user_ids):
+        summary += f"\nAktif üyeliği olmayan: {len(user_ids) - len(changed)}"
+    if invalid:
+        summary += f"\nGeçersiz giriş: {len(invalid)} ({', '.join(invalid[:5])})"
+    if changed:
+        summary += "\n\n📨 Bildirimler arka planda gönderiliyor."
+        # Davet bağlantıları, gruptan çıkarma ve bildirimler yanıtı bekletmez
+        context.application.create_task(deliver_bulk(context.bot, action, changed, days))
+    logging.info(summary.replace('\n', ' '))
+    await update.message.reply_text(summary)
+
+async def deliver_bulk(bot, action: str, changed: list, days: int) -> None:
+    """Toplu işlemden etkilenen üyeleri arka planda bilgilendir veya gruptan çıkar"""
+    try:
+        if action == 'revoke':
+            # Gruptan çıkarma ve bildirim hız sınırı altında eşzamanlı yapılır
+            failed = await expiry_pipeline.remove(bot, [user_id for user_id, _ in changed], NOTIFY_REVOKED)
+        else:
+            async def notify(user_id: int, expire_at: int):
+                if action == 'approve':
+                    invite_link = await invite_pool.take(bot, user_id)
+                    text = (
+                        "✅ Ödemeniz onaylandı!\n\n"
+                        "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
+                        f"{invite_link}\n\n"
+                        f"⚠️ Üyeliğiniz {days} gün boyunca aktif kalacaktır."
+                    )
+                else:
+                    text = (
+                        f"✅ VIP üyeliğiniz {days} gün uzatıldı.\n"
+                        f"📌 Yeni bitiş: {datetime.fromtimestamp(expire_at).strftime('%d.%m.%Y')}"
+                    )
+                await send_safe_message(user_id, text, PRIORITY_BULK)
+            
+            results = await asyncio.gather(
+                *(notify(user_id, expire_at) for user_id, expire_at in changed),
+                return_exceptions=True
+            )
+            failed = sum(1 for result in results if isinstance(result, Exception))
+        logging.info(f"Toplu işlem bildirimleri tamamlandı - İşlem: {action}, Üye: {len(changed)}, Başarısız: {failed}")
+    except Exception as e:
+        logging.error(f"Toplu işlem bildirimleri hatası: {str(e)}")
+
+async def bulk_approve_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için toplu ödeme onaylama komutu"""
+    await bulk_members(update, context, 'approve')
+
+async def bulk_extend_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için toplu üyelik uzatma komutu"""
+    await bulk_members(update, context, 'extend')
+
+async def bulk_revoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için toplu üyelik iptal komutu"""
+    await bulk_members(update, context, 'revoke')
+
 async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Dekont işleme"""
     if not context.user_data.get('waiting_for_receipt'):
@@ -476,42 +606,23 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_id = update.effective_user.id
     
     # Dekont fotoğraf mı dosya mı kontrol et
-    if update.message.photo:
-        file_id = update.message.photo[-1].file_id
-    elif update.message.document:
-        file_id = update.message.document.file_id
-    else:
+    if not (update.message.photo or update.message.document):
         await update.message.reply_text(
             "❌ Lütfen dekontu fotoğraf veya dosya olarak gönderin."
         )
         return
     
-    # Admin'e bildirim gönder
-    admin_id = os.getenv('ADMIN_ID')
     try:
-        await context.bot.send_message(
-            chat_id=admin_id,
-            text=(
-                "💳 Yeni Ödeme Dekontu\n\n"
-                f"👤 Kullanıcı ID: {user_id}\n"
-                f"📅 Tarih: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n\n"
-                "Onaylamak için:\n"
-                f"/approve_payment {user_id}"
-            )
-        )
-        # Dekontu forward et
-        if update.message.photo:
-            await context.bot.send_photo(
-                chat_id=admin_id,
-                photo=file_id,
-                caption=f"Dekont - Kullanıcı ID: {user_id}"
-            )
-        else:
-            await context.bot.send_document(
-                chat_id=admin_id,
-                document=file_id,
-                caption=f"Dekont - Kullanıcı ID: {user_id}"
+        # Dekont inceleme kuyruğuna eklenir, admin'e periyodik özetle bildirilir
+        _, original = await receipt_queue.submit(context.bot, user_id, update.message)
+        
+        if original and original['user_id'] == user_id and original['status'] == 'pending':
+            await update.message.reply_text(
+                "ℹ️ Bu dekont daha önce alındı ve inceleme sırasında.\n"
+                "Onay sonrası gruba ekleneceksiniz."
             )
+            context.user_data['waiting_for_receipt'] = False
+            return
         
         # Kullanıcıya bilgi ver
         await update.message.reply_text(
@@ -530,6 +641,205 @@ async def handle_receipt(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             "Lütfen daha sonra tekrar deneyin."
         )
 
+async def receipt_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için kuyruktaki dekontu görüntüleme komutu"""
+    if str(update.effective_user.id) != os.getenv('ADMIN_ID'):
+        await update.message.reply_text("Bu komut sadece yöneticiler içindir.")
+        return
+    
+    if len(context.args) != 1 or not context.args[0].isdigit():
+        await update.message.reply_text(
+            "❌ Dekont numarası gerekli.\n"
+            "Örnek: /receipt 42"
+        )
+        return
+    
+    receipt = await db.get_receipt(int(context.args[0]))
+    if not receipt:
+        await update.message.reply_text("❌ Dekont bulunamadı.")
+        return
+    
+    caption = (
+        f"Dekont #{receipt['id']} - Kullanıcı ID: {receipt['user_id']}\n"
+        f"Durum: {receipt['status']}"
+    )
+    if receipt['duplicate_of']:
+        caption += f"\n⚠️ Tekrar: #{receipt['duplicate_of']}"
+    try:
+        if receipt['media_type'] == 'photo':
+            await dispatcher.submit(
+                'send_photo',
+                PRIORITY_NORMAL,
+                chat_id=update.effective_chat.id,
+                photo=receipt['file_id'],
+                caption=caption
+            )
+        else:
+            await dispatcher.submit(
+                'send_document',
+                PRIORITY_NORMAL,
+                chat_id=update.effective_chat.id,
+                document=receipt['file_id'],
+                caption=caption
+            )
+    except Exception as e:
+        logging.error(f"Dekont gönderme hatası: {str(e)}")
+        await update.message.reply_text("❌ Dekont gönderilemedi.")
+
+async def handle_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Gruba katılma isteğini aktif üyelik varsa onayla, yoksa reddet"""
+    request = update.chat_join_request
+    user_id = request.from_user.id
+    
+    try:
+        if user_id in active_members:
+            await request.approve()
+            logging.info(f"Katılma isteği onaylandı - User ID: {user_id}")
+            return
+        
+        await request.decline()
+        logging.info(f"Katılma isteği reddedildi, aktif üyelik yok - User ID: {user_id}")
+        # Bildirim beklenmez; yoğun isteklerde sıradaki istek hemen işlenir
+        notice = dispatcher.submit(
+            'send_message',
+            PRIORITY_NORMAL,
+            chat_id=request.user_chat_id,
+            text="❌ Aktif VIP üyeliğiniz bulunmadığı için katılma isteğiniz reddedildi.\n"
+                 "Üyelik için /start komutunu kullanabilirsiniz."
+        )
+        
+        def log_failure(future):
+            if not future.cancelled() and future.exception() is not None:
+                logging.error(f"Ret bildirimi gönderilemedi - User ID: {user_id}, Hata: {str(future.exception())}")
+        notice.add_done_callback(log_failure)
+    except Exception as e:
+        logging.error(f"Katılma isteği işlenirken hata - User ID: {user_id}, Hata: {str(e)}")
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Admin için çalışma zamanı metrikleri"""
+    if str(update.effective_user.id) != os.getenv('ADMIN_ID'):
+        await update.message.reply_text("Bu komut sadece yöneticiler içindir.")
+        return
+    
+    metrics = dispatcher.metrics()
+    depth = metrics['queue_depth']
+    cache = db.member_cache.metrics()
+    await update.message.reply_text(
+        "📊 Mesaj Kuyruğu\n\n"
+        f"Yüksek öncelik: {depth['high']}\n"
+        f"Normal: {depth['normal']}\n"
+        f"Toplu: {depth['bulk']}\n\n"
+        f"Gönderilen: {metrics['sent']}\n"
+        f"Başarısız: {metrics['failed']}\n"
+        f"Hız sınırı nedeniyle tekrar: {metrics['retried']}\n\n"
+        "🗂 Üye Önbelleği\n\n"
+        f"Kayıt: {cache['size']}\n"
+        f"İsabet: {cache['hits']}, Iska: {cache['misses']}\n"
+        f"İsabet oranı: %{cache['hit_rate'] * 100:.1f}"
+    )
+
+async def confirm_payment(bot, payment_id: str, status: str) -> bool:
+    """Ödeme durumunu kaydet, ilk onayda üyeliği ver ve davet bağlantısını gönder"""
+    payment = await db.get_payment(payment_id)
+    if not payment:
+        logging.warning(f"Bilinmeyen ödeme için durum bildirimi: {payment_id}")
+        return False
+    
+    if status in TERMINAL_STATUSES:
+        payment_poller.untrack(payment_id)
+    if status not in OPEN_STATUSES:
+        invoice_cache.discard(payment_id)
+    # Aynı durumun tekrar bildirimi yazma gerektirmez
+    if status == payment['status'] and (status not in PAID_STATUSES or payment['completed_at']):
+        return False
+    
+    # Yalnızca ilk onay üyelik verir; ödeme ve üyelik tek işlemde yazılır
+    expire_at = None
+    if status in PAID_STATUSES:
+        expire_at = await db.complete_payment(payment_id, status, int(time.time()))
+    if expire_at is None:
+        await db.update_payment_status(payment_id, status)
+        return False
+    
+    await grant_payment(bot, payment['telegram_id'], payment_id, expire_at)
+    return True
+
+async def grant_payment(bot, user_id: int, payment_id: str, expire_at: int):
+    """Üyeliği veritabanına yazılmış kullanıcıyı takibe al ve kişiye özel davet bağlantısını gönder"""
+    active_members.add(user_id, expire_at)
+    expiry_scheduler.schedule(user_id, expire_at)
+    logging.info(f"Ödeme onaylandı, üyelik verildi - User ID: {user_id}, Payment ID: {payment_id}")
+    
+    try:
+        invite_link = await invite_pool.take(bot, user_id, payment_id)
+        await send_safe_message(
+            user_id,
+            "✅ Ödemeniz onaylandı!\n\n"
+            "Gruba katılmak için aşağıdaki bağlantıyı kullanın:\n"
+            f"{invite_link}\n\n"
+            "⚠️ Üyeliğiniz 30 gün boyunca aktif kalacaktır.\n"
+            "📅 Süre sonunda otomatik olarak gruptan çıkarılacaksınız.",
+            PRIORITY_HIGH
+        )
+    except Exception as e:
+        logging.error(f"Onay bildirimi hatası: {str(e)}")
+
+async def apply_payment_changes(bot, changes: list) -> None:
+    """Toplu eşitlemede değişen ödemelerin takibini güncelle, ilk kez ödenenlere üyelik ver"""
+    for payment_id, user_id, status, expire_at in changes:
+        payment_processor.invalidate_status(payment_id)
+        if status in TERMINAL_STATUSES:
+            payment_poller.untrack(payment_id)
+        if status not in OPEN_STATUSES:
+            invoice_cache.discard(payment_id)
+    # Üyelikler veritabanında zaten verildi; bir bildirimin hatası diğerlerini durdurmaz
+    results = await asyncio.gather(*(
+        grant_payment(bot, user_id, payment_id, expire_at)
+        for payment_id, user_id, status, expire_at in changes
+        if expire_at is not None
+    ), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Üyelik bildirimi hatası: {str(result)}")
+
+# Webhook gecikmelerine karşı açık ödemeleri sorgulayan yedek mekanizma
+payment_poller = PaymentPoller(payment_processor, confirm_payment)
+# Yeniden başlatmada açık ödemelerin takibini kaldığı yerden sürdürür
+payment_reconciler = PaymentReconciler(db, payment_processor, payment_poller, confirm_payment)
+# Sağlayıcının ödeme listesinden değişenleri toplu olarak eşitler
+payment_list_reconciler = PaymentListReconciler(db, payment_processor, apply_payment_changes)
+
+async def post_init(application: Application) -> None:
+    """Uygulama başlarken paylaşılan kaynakları hazırla"""
+    await dispatcher.start(application.bot)
+    
+    if os.path.exists(LEGACY_MEMBERS_DB):
+        await db.import_members_db(LEGACY_MEMBERS_DB)
+        os.replace(LEGACY_MEMBERS_DB, f"{LEGACY_MEMBERS_DB}.imported")
+    
+    await active_members.load()
+    await payment_processor.start()
+    
+    if os.getenv('NOWPAYMENTS_IPN_SECRET'):
+        async def on_ipn(payment_id: str, status: str, payload: dict) -> None:
+            payment_processor.invalidate_status(payment_id)
+            await confirm_payment(application.bot, payment_id, status)
+        
+        ipn_server = IPNServer(on_ipn)
+        await ipn_server.start()
+        application.bot_data['ipn_server'] = ipn_server
+    else:
+        logging.warning("NOWPAYMENTS_IPN_SECRET tanımlı değil, IPN sunucusu başlatılmadı")
+
+async def post_shutdown(application: Application) -> None:
+    """Uygulama kapanırken paylaşılan kaynakları serbest bırak"""
+    ipn_server = application.bot_data.get('ipn_server')
+    if ipn_server:
+        await ipn_server.stop()
+    await payment_processor.close()
+    await dispatcher.stop()
+    await db.close()
+
 def main() -> None:
     """Bot başlatma fonksiyonu"""
     # Daha uzun timeout değerleri ile application oluştur
@@ -539,6 +849,12 @@ def main() -> None:
         .connect_timeout(30.0)  # 30 saniye
         .read_timeout(30.0)     # 30 saniye
         .write_timeout(30.0)    # 30 saniye
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        # Kullanıcı akışları süreçler arasında paylaşılır ve yeniden başlatmada korunur
+        .persistence(SQLitePersistence(db))
+        # Farklı sohbetlerin güncellemeleri eşzamanlı, aynı sohbetinkiler sırayla işlenir
+        .concurrent_updates(ChatOrderedUpdateProcessor())
         .build()
     )
     
@@ -563,39 +879,88 @@ def main() -> None:
     application.add_handler(CommandHandler("status", status_command))
     
     # Üyelik kontrolü için komut ekle
-    application.add_handler(CommandHandler("check_expired", check_expired_members))
+    application.add_handler(CommandHandler("check_expired", check_expired_command))
     
     # Üyelik onaylama için komut ekle
     application.add_handler(CommandHandler("approve_payment", approve_payment))
     
+    # Toplu üyelik işlemleri
+    application.add_handler(CommandHandler("bulk_approve", bulk_approve_command))
+    application.add_handler(CommandHandler("bulk_extend", bulk_extend_command))
+    application.add_handler(CommandHandler("bulk_revoke", bulk_revoke_command))
+    
+    # Kuyruktaki dekontu görüntüle
+    application.add_handler(CommandHandler("receipt", receipt_command))
+    
+    # Çalışma zamanı metrikleri
+    application.add_handler(CommandHandler("metrics", metrics_command))
+    
+    # Gruba katılma istekleri yalnızca aktif üyeler için onaylanır
+    if os.getenv('TELEGRAM_GROUP_ID'):
+        application.add_handler(ChatJoinRequestHandler(
+            handle_join_request,
+            chat_id=int(os.getenv('TELEGRAM_GROUP_ID'))
+        ))
+    
     # Dekont handler
     application.add_handler(MessageHandler(
         filters.PHOTO | filters.Document.ALL,
         handle_receipt
     ))
     
-    # Veritabanını başlat
-    init_db()
-    
     # Job queue ayarları
     if application.job_queue:
-        # Her 24 saatte bir kontrol
+        # Diğer süreçlerdeki üyelik değişikliklerini belleğe al
+        active_members.start(application.job_queue)
+        # Davet bağlantısı havuzunu doldur, kullanılmayanları iptal et
+        invite_pool.start(application.job_queue)
+        # Bekleyen dekontları admin'e toplu özetle bildir
+        receipt_queue.start(application.job_queue)
+        # Üyelikleri bitiş zamanlarında sonlandır
+        expiry_scheduler.start(application.job_queue)
+        # Başarısız gruptan çıkarma/bildirim adımlarını yeniden dene
+        application.job_queue.run_repeating(
+            expiry_pipeline.retry_due,
+            interval=timedelta(seconds=int(os.getenv('EXPIRY_RETRY_INTERVAL_SECONDS', 60))),
+            first=timedelta(seconds=30)
+        )
+        # Kapanış öncesinde açık kalan ödemeleri uzlaştır ve takibe al
+        application.job_queue.run_once(payment_reconciler.run, when=timedelta(seconds=5))
+        # Ödeme listesi hesap bilgisi gerektirir; tanımlıysa periyodik toplu eşitleme yap
+        if os.getenv('NOWPAYMENTS_EMAIL'):
+            application.job_queue.run_repeating(
+                payment_list_reconciler.run,
+                interval=timedelta(seconds=int(os.getenv('LIST_RECONCILE_INTERVAL_SECONDS', 300))),
+                first=timedelta(seconds=60)
+            )
+        # Açık ödemelerin durumunu arka planda sorgula
         application.job_queue.run_repeating(
-            check_expired_members,
-            interval=timedelta(hours=24),
-            first=timedelta(minutes=1)
+            payment_poller.poll_due,
+            interval=timedelta(seconds=int(os.getenv('POLLER_TICK_SECONDS', 5))),
+            first=timedelta(seconds=10)
         )
         logging.info("Job queue başarıyla başlatıldı")
     else:
         logging.warning("Job queue başlatılamadı!")
     
     # Botu başlat
-    application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
-        pool_timeout=30.0,
-        read_timeout=30.0,
-        write_timeout=30.0
-    )
+    if os.getenv('BOT_MODE', 'polling') == 'webhook':
+        # Güncellemeler Telegram'dan yerel HTTP dinleyicisine itilir
+        application.run_webhook(
+            listen=os.getenv('TELEGRAM_WEBHOOK_LISTEN', '0.0.0.0'),
+            port=int(os.getenv('TELEGRAM_WEBHOOK_PORT', 8443)),
+            url_path=os.getenv('TELEGRAM_WEBHOOK_PATH', 'telegram'),
+            webhook_url=os.getenv('TELEGRAM_WEBHOOK_URL'),
+            secret_token=os.getenv('TELEGRAM_WEBHOOK_SECRET'),
+            allowed_updates=Update.ALL_TYPES
+        )
+    else:
+        application.run_polling(
+            allowed_updates=Update.ALL_TYPES,
+            pool_timeout=30.0,
+            read_timeout=30.0,
+            write_timeout=30.0
+        )
 
 if __name__ == '__main__':
     main()
@@ -1,59 +1,358 @@
+import os
+import time
 import sqlite3
-from datetime import datetime, timedelta
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import logging
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterable, Tuple
+from member_cache import MemberCache, MISS
 
 logger = logging.getLogger(__name__)
 
+def _iso_to_epoch(value) -> Optional[int]:
+    """Eski kayıtlardaki ISO tarih metnini epoch saniyeye çevir"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.fromisoformat(value).timestamp())
+
 class Database:
-    def __init__(self, db_name: str = 'crypto_payment.db'):
+    def __init__(self, db_name: str = 'crypto_payment.db', persistent: bool = False):
         self.db_name = db_name
+        self.persistent = persistent  # True ise her iş parçacığı tek bağlantıyı yeniden kullanır
+        self._local = threading.local()
+        # Üyelik okumaları önbellekten yanıtlanır, üyelik yazmaları önbelleği de günceller
+        self.member_cache = MemberCache()
         self.init_db()
 
-    def init_db(self):
-        """Veritabanı tablolarını oluştur"""
-        with self._connect() as conn:
-            cursor = conn.cursor()
-            
-            # Kullanıcılar tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    telegram_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    subscription_start_date TEXT,
-                    subscription_end_date TEXT,
-                    created_at TEXT
-                )
-            ''')
-            
-            # Ödemeler tablosu
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS payments (
-                    payment_id TEXT PRIMARY KEY,
-                    telegram_id INTEGER,
-                    amount REAL,
-                    status TEXT,
-                    created_at TEXT,
-                    completed_at TEXT,
-                    FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
-                )
-            ''')
-            
-            conn.commit()
-
     def _connect(self):
         """Veritabanı bağlantısı oluştur"""
-        return sqlite3.connect(self.db_name)
+        if not self.persistent:
+            return sqlite3.connect(self.db_name)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_persistent()
+            self._local.conn = conn
+        return conn
+
+    def _open_persistent(self) -> sqlite3.Connection:
+        """Kalıcı bağlantıyı aç ve performans ayarlarını uygula"""
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', 5)),
+            cached_statements=int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+        )
+        # WAL okuyucuların yazıcıyı beklemesini önler, NORMAL senkronizasyon
+        # WAL modunda her commit'te fsync yapmadan tutarlılığı korur
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f"PRAGMA cache_size = -{int(os.getenv('SQLITE_CACHE_KB', 8192))}")
+        conn.execute(f"PRAGMA mmap_size = {int(os.getenv('SQLITE_MMAP_BYTES', 64 * 1024 * 1024))}")
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    def close(self):
+        """Bu iş parçacığının kalıcı bağlantısını kapat"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def init_db(self):
+        """Şemayı oluştur ve bekleyen migration'ları sırayla uygula"""
+        conn = self._connect()
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for target, migration in enumerate(self._MIGRATIONS, start=1):
+                if version >= target:
+                    continue
+                # Her migration sürüm numarasıyla birlikte tek işlemde uygulanır; yazma kilidi
+                # alındıktan sonra sürüm yeniden okunur, aynı anda açılan başka bir süreç
+                # migration'ı zaten uyguladıysa atlanır
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    version = conn.execute('PRAGMA user_version').fetchone()[0]
+                    if version >= target:
+                        conn.rollback()
+                        continue
+                    migration(self, conn)
+                    conn.execute(f'PRAGMA user_version = {target}')
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                logger.info(f"Veritabanı şeması {target}. sürüme yükseltildi: {self.db_name}")
+        finally:
+            if not self.persistent:
+                conn.close()
+
+    def _migrate_legacy_schema(self, conn: sqlite3.Connection):
+        """1: İlk sürümdeki users ve payments tabloları"""
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS users (
+                telegram_id INTEGER PRIMARY KEY,
+                username TEXT,
+                subscription_start_date TEXT,
+                subscription_end_date TEXT,
+                created_at TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                payment_id TEXT PRIMARY KEY,
+                telegram_id INTEGER,
+                amount REAL,
+                status TEXT,
+                created_at TEXT,
+                completed_at TEXT,
+                FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
+            )
+        ''')
+
+    def _migrate_unified_members(self, conn: sqlite3.Connection):
+        """2: users tablosunu members tablosunda birleştir ve indeksleri ekle"""
+        conn.execute('''
+            CREATE TABLE members (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                join_date TEXT,
+                expire_date TEXT,
+                is_active INTEGER NOT NULL DEFAULT 1,
+                created_at TEXT
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO members (user_id, username, join_date, expire_date, is_active, created_at)
+            SELECT telegram_id, username, subscription_start_date, subscription_end_date,
+                   COALESCE(subscription_end_date > ?, 0), created_at
+            FROM users
+        ''', (datetime.now().isoformat(),))
+        
+        # Yabancı anahtarın members tablosunu göstermesi için payments yeniden oluşturulur
+        conn.execute('''
+            CREATE TABLE payments_new (
+                payment_id TEXT PRIMARY KEY,
+                telegram_id INTEGER,
+                amount REAL,
+                status TEXT,
+                created_at TEXT,
+                completed_at TEXT,
+                FOREIGN KEY (telegram_id) REFERENCES members (user_id)
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO payments_new
+            SELECT payment_id, telegram_id, amount, status, created_at, completed_at
+            FROM payments
+        ''')
+        conn.execute('DROP TABLE payments')
+        conn.execute('ALTER TABLE payments_new RENAME TO payments')
+        conn.execute('DROP TABLE users')
+        
+        conn.execute('CREATE INDEX idx_members_expire_date ON members (expire_date)')
+        conn.execute('CREATE INDEX idx_payments_telegram_id ON payments (telegram_id)')
+        conn.execute('CREATE INDEX idx_payments_status ON payments (status)')
+
+    def _migrate_epoch_timestamps(self, conn: sqlite3.Connection):
+        """3: Tarihleri tamsayı epoch sütunlarına çevir ve kapsayan indeksleri ekle"""
+        conn.create_function('iso_to_epoch', 1, _iso_to_epoch, deterministic=True)
+        conn.execute('''
+            CREATE TABLE members_new (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                join_date INTEGER,
+                expire_date INTEGER,
+                is_active INTEGER NOT NULL DEFAULT 1,
+                created_at INTEGER
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO members_new
+            SELECT user_id, username, iso_to_epoch(join_date), iso_to_epoch(expire_date),
+                   is_active, iso_to_epoch(created_at)
+            FROM members
+        ''')
+        conn.execute('''
+            CREATE TABLE payments_new (
+                payment_id TEXT PRIMARY KEY,
+                telegram_id INTEGER,
+                amount REAL,
+                status TEXT,
+                created_at INTEGER,
+                completed_at INTEGER,
+                FOREIGN KEY (telegram_id) REFERENCES members (user_id)
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO payments_new
+            SELECT payment_id, telegram_id, amount, status,
+                   iso_to_epoch(created_at), iso_to_epoch(completed_at)
+            FROM payments
+        ''')
+        conn.execute('DROP TABLE payments')
+        conn.execute('DROP TABLE members')
+        conn.execute('ALTER TABLE members_new RENAME TO members')
+        conn.execute('ALTER TABLE payments_new RENAME TO payments')
+        
+        # Süre taraması ve durum sorguları tabloya dokunmadan indeksten yanıtlanır
+        conn.execute('CREATE INDEX idx_members_active_expire ON members (is_active, expire_date)')
+        conn.execute('CREATE INDEX idx_payments_status_created ON payments (status, created_at)')
+        conn.execute('CREATE INDEX idx_payments_telegram_id ON payments (telegram_id)')
+
+    def _migrate_expiry_retries(self, conn: sqlite3.Connection):
+        """4: Başarısız üyelik sonlandırma adımları için yeniden deneme kuyruğu"""
+        conn.execute('''
+            CREATE TABLE expiry_retries (
+                user_id INTEGER NOT NULL,
+                action TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                next_attempt_at INTEGER NOT NULL,
+                last_error TEXT,
+                PRIMARY KEY (user_id, action)
+            )
+        ''')
+        conn.execute('CREATE INDEX idx_expiry_retries_next ON expiry_retries (next_attempt_at)')
+
+    def _migrate_sync_cursors(self, conn: sqlite3.Connection):
+        """5: Dış kaynaklardan artımlı okuma için kalıcı imleçler"""
+        conn.execute('''
+            CREATE TABLE sync_cursors (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+
+    def _migrate_invoice_details(self, conn: sqlite3.Connection):
+        """6: Açık faturanın tekrar gösterilebilmesi için adres, tutar ve bitiş zamanı"""
+        conn.execute('ALTER TABLE payments ADD COLUMN pay_address TEXT')
+        conn.execute('ALTER TABLE payments ADD COLUMN pay_amount TEXT')
+        conn.execute('ALTER TABLE payments ADD COLUMN expires_at INTEGER')
+        # Kullanıcının süresi dolmamış faturaları indeksle bulunur; durum ve adres
+        # sütunları için yalnızca bu birkaç satır tablodan okunur
+        conn.execute('DROP INDEX idx_payments_telegram_id')
+        conn.execute('CREATE INDEX idx_payments_telegram_expires ON payments (telegram_id, expires_at)')
+
+    def _migrate_bot_state(self, conn: sqlite3.Connection):
+        """7: Süreçler arasında paylaşılan bot durumu (user_data, chat_data, konuşmalar)"""
+        conn.execute('''
+            CREATE TABLE bot_state (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                PRIMARY KEY (kind, key)
+            ) WITHOUT ROWID
+        ''')
+
+    def _migrate_unsettled_payments_index(self, conn: sqlite3.Connection):
+        """8: Açık ödemelerin oluşturulma sırasıyla sayfalı okunması için kısmi indeks"""
+        # status indekse dahildir; kesinleşmiş durumlar tabloya gitmeden elenir
+        conn.execute('''
+            CREATE INDEX idx_payments_unsettled ON payments (created_at, payment_id, status)
+            WHERE completed_at IS NULL
+        ''')
+
+    def _migrate_invite_links(self, conn: sqlite3.Connection):
+        """9: Tek kullanımlık davet bağlantıları ve verildikleri üyeler"""
+        conn.execute('''
+            CREATE TABLE invite_links (
+                invite_link TEXT PRIMARY KEY,
+                created_at INTEGER NOT NULL,
+                expires_at INTEGER NOT NULL,
+                user_id INTEGER,
+                payment_id TEXT,
+                issued_at INTEGER,
+                revoked_at INTEGER
+            ) WITHOUT ROWID
+        ''')
+        # Havuzdaki (verilmemiş, iptal edilmemiş) bağlantılar indeksten okunur
+        conn.execute('''
+            CREATE INDEX idx_invite_links_pool ON invite_links (expires_at)
+            WHERE user_id IS NULL AND revoked_at IS NULL
+        ''')
+        conn.execute('CREATE INDEX idx_invite_links_user ON invite_links (user_id)')
+
+    def _migrate_receipts(self, conn: sqlite3.Connection):
+        """10: İnceleme bekleyen dekontlar ve tekrar kullanım tespiti"""
+        conn.execute('''
+            CREATE TABLE receipts (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                file_id TEXT NOT NULL,
+                file_unique_id TEXT NOT NULL,
+                media_type TEXT NOT NULL,
+                image_hash INTEGER,
+                duplicate_of INTEGER,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at INTEGER NOT NULL,
+                digested_at INTEGER
+            )
+        ''')
+        # Aynı dosya veya aynı görüntü daha önce gönderildiyse indeksten bulunur
+        conn.execute('CREATE INDEX idx_receipts_file ON receipts (file_unique_id)')
+        conn.execute('CREATE INDEX idx_receipts_hash ON receipts (image_hash) WHERE image_hash IS NOT NULL')
+        conn.execute('CREATE INDEX idx_receipts_user ON receipts (user_id, status)')
+        # Özete henüz girmemiş dekontlar tabloyu taramadan okunur
+        conn.execute('CREATE INDEX idx_receipts_undigested ON receipts (id) WHERE digested_at IS NULL')
+
+    # Sıra önemlidir: yeni migration'lar listenin sonuna eklenir
+    _MIGRATIONS = (
+        _migrate_legacy_schema,
+        _migrate_unified_members,
+        _migrate_epoch_timestamps,
+        _migrate_expiry_retries,
+        _migrate_sync_cursors,
+        _migrate_invoice_details,
+        _migrate_bot_state,
+        _migrate_unsettled_payments_index,
+        _migrate_invite_links,
+        _migrate_receipts,
+    )
+
+    def import_members_db(self, path: str = 'members.db') -> int:
+        """Eski members.db dosyasındaki üyelikleri tek seferlik içe aktar"""
+        conn = self._connect()
+        try:
+            conn.create_function('iso_to_epoch', 1, _iso_to_epoch, deterministic=True)
+            conn.execute('ATTACH DATABASE ? AS legacy', (path,))
+            try:
+                with conn:
+                    cursor = conn.execute('''
+                        INSERT INTO members (user_id, join_date, expire_date, is_active, created_at)
+                        SELECT user_id, iso_to_epoch(join_date), iso_to_epoch(expire_date),
+                               is_active, iso_to_epoch(join_date)
+                        FROM legacy.members WHERE true
+                        ON CONFLICT (user_id) DO UPDATE SET
+                            join_date = excluded.join_date,
+                            expire_date = excluded.expire_date,
+                            is_active = excluded.is_active
+                        WHERE excluded.expire_date > members.expire_date
+                            OR members.expire_date IS NULL
+                    ''')
+                    imported = cursor.rowcount
+            finally:
+                conn.execute('DETACH DATABASE legacy')
+            logger.info(f"{path} dosyasından {imported} üyelik aktarıldı")
+            return imported
+        finally:
+            if not self.persistent:
+                conn.close()
 
     def get_user(self, telegram_id: int) -> Optional[Dict]:
         """Kullanıcı bilgilerini getir"""
         try:
             with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute(
-                    'SELECT * FROM users WHERE telegram_id = ?',
-                    (telegram_id,)
-                )
+                cursor.execute('''
+                    SELECT user_id, username, join_date, expire_date, created_at
+                    FROM members
+                    WHERE user_id = ?
+                ''', (telegram_id,))
                 user = cursor.fetchone()
                 
                 if user:
@@ -69,76 +368,202 @@ class Database:
             logger.error(f"Kullanıcı bilgisi alınırken hata: {e}")
             return None
 
+    # Bitiş zamanını SQL içinde max(şimdi, mevcut bitiş) + süre olarak hesaplayan tek ifadelik upsert
+    _UPSERT_SUBSCRIPTION = '''
+        INSERT INTO members (
+            user_id, username,
+            join_date,
+            expire_date,
+            is_active,
+            created_at
+        ) VALUES (
+            :telegram_id, :username, :now,
+            :now + :duration,
+            1,
+            :now
+        )
+        ON CONFLICT (user_id) DO UPDATE SET
+            username = COALESCE(excluded.username, members.username),
+            expire_date = MAX(COALESCE(members.expire_date, :now), :now) + :duration,
+            is_active = 1
+    '''
+    _MEMBER_COLUMNS = 'user_id, join_date, expire_date, is_active'
+
     def update_subscription(self, telegram_id: int, username: str, days: int) -> bool:
         """Kullanıcı aboneliğini güncelle veya oluştur"""
         try:
-            now = datetime.now()
             with self._connect() as conn:
-                cursor = conn.cursor()
-                
-                # Mevcut kullanıcıyı kontrol et
-                user = self.get_user(telegram_id)
-                
-                if user:
-                    # Mevcut abonelik varsa üzerine ekle
-                    current_end = datetime.fromisoformat(user['subscription_end_date']) \
-                        if user['subscription_end_date'] else now
-                    
-                    if current_end < now:
-                        current_end = now
-                    
-                    new_end = current_end + timedelta(days=days)
-                    
-                    cursor.execute('''
-                        UPDATE users 
-                        SET username = ?,
-                            subscription_end_date = ?
-                        WHERE telegram_id = ?
-                    ''', (username, new_end.isoformat(), telegram_id))
-                else:
-                    # Yeni kullanıcı oluştur
-                    end_date = now + timedelta(days=days)
-                    cursor.execute('''
-                        INSERT INTO users (
-                            telegram_id, username,
-                            subscription_start_date,
-                            subscription_end_date,
-                            created_at
-                        ) VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        telegram_id, username,
-                        now.isoformat(),
-                        end_date.isoformat(),
-                        now.isoformat()
-                    ))
-                
+                row = conn.execute(f"{self._UPSERT_SUBSCRIPTION} RETURNING {self._MEMBER_COLUMNS}", {
+                    'telegram_id': telegram_id,
+                    'username': username,
+                    'now': int(time.time()),
+                    'duration': int(days) * 86400
+                }).fetchone()
                 conn.commit()
-                return True
+            self._cache_member(row)
+            return True
         except Exception as e:
             logger.error(f"Abonelik güncellenirken hata: {e}")
             return False
 
+    def bulk_update_subscriptions(self, subscriptions: Iterable[Tuple[int, str, int]]) -> int:
+        """(telegram_id, username, days) kayıtlarını tek işlemde uygula, uygulanan sayıyı döndür"""
+        now = int(time.time())
+        params = [
+            {
+                'telegram_id': telegram_id,
+                'username': username,
+                'now': now,
+                'duration': int(days) * 86400
+            }
+            for telegram_id, username, days in subscriptions
+        ]
+        try:
+            with self._connect() as conn:
+                conn.executemany(self._UPSERT_SUBSCRIPTION, params)
+                # Önbellekteki üyelikler yeni bitiş zamanlarıyla güncellenir
+                cached = [p['telegram_id'] for p in params if p['telegram_id'] in self.member_cache]
+                for i in range(0, len(cached), 500):
+                    chunk = cached[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    for row in conn.execute(
+                            f"SELECT {self._MEMBER_COLUMNS} FROM members WHERE user_id IN ({placeholders})",
+                            chunk):
+                        self._cache_member(row)
+                conn.commit()
+                return len(params)
+        except Exception as e:
+            logger.error(f"Toplu abonelik güncellenirken hata: {e}")
+            return 0
+
     def add_payment(self, payment_id: str, telegram_id: int,
-                   amount: float, status: str = 'pending') -> bool:
+                   amount: float, status: str = 'pending',
+                   pay_address: str = None, pay_amount: str = None,
+                   expires_at: int = None) -> bool:
         """Yeni ödeme kaydı ekle"""
         try:
-            now = datetime.now().isoformat()
+            now = int(time.time())
             with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO payments (
                         payment_id, telegram_id, amount,
-                        status, created_at
-                    ) VALUES (?, ?, ?, ?, ?)
-                ''', (payment_id, telegram_id, amount, status, now))
+                        status, created_at,
+                        pay_address, pay_amount, expires_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (payment_id, telegram_id, amount, status, now,
+                      pay_address, pay_amount, expires_at))
                 conn.commit()
                 return True
         except Exception as e:
             logger.error(f"Ödeme eklenirken hata: {e}")
             return False
 
+    def get_open_payments_by_address(self, pay_address: str, since: int) -> list:
+        """Adrese ait, since sonrasında oluşturulmuş kesinleşmemiş ödemeleri
+        (payment_id, telegram_id, amount, status, created_at, expires_at) olarak getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT payment_id, telegram_id, amount, status, created_at, expires_at
+                FROM payments
+                WHERE completed_at IS NULL AND created_at >= ?
+                  AND pay_address = ? AND status IN ('pending', 'expired')
+                  AND expires_at IS NOT NULL
+            ''', (since, pay_address))
+            return cursor.fetchall()
+
+    def get_payment(self, payment_id: str) -> Optional[Dict]:
+        """Ödeme kaydını getir"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    'SELECT * FROM payments WHERE payment_id = ?',
+                    (payment_id,)
+                )
+                payment = cursor.fetchone()
+                
+                if payment:
+                    return {
+                        'payment_id': payment[0],
+                        'telegram_id': payment[1],
+                        'amount': payment[2],
+                        'status': payment[3],
+                        'created_at': payment[4],
+                        'completed_at': payment[5]
+                    }
+                return None
+        except Exception as e:
+            logger.error(f"Ödeme bilgisi alınırken hata: {e}")
+            return None
+
+    def get_open_payment(self, telegram_id: int, open_statuses: Iterable[str],
+                         min_expires_at: int = None) -> Optional[Dict]:
+        """Kullanıcının min_expires_at sonrasında bitecek, henüz ödenmemiş son faturasını getir"""
+        statuses = list(open_statuses)
+        placeholders = ','.join('?' * len(statuses))
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT payment_id, amount, pay_address, pay_amount, expires_at
+                FROM payments
+                WHERE telegram_id = ? AND expires_at > ?
+                  AND completed_at IS NULL AND status IN ({placeholders})
+                ORDER BY expires_at DESC
+                LIMIT 1
+            ''', (telegram_id, min_expires_at or int(time.time()), *statuses))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return {
+                'payment_id': row[0],
+                'amount': row[1],
+                'pay_address': row[2],
+                'pay_amount': row[3],
+                'expires_at': row[4]
+            }
+
+    # Ödemesi onaylanan kullanıcının üyeliğini onay anından başlatır
+    _GRANT_MEMBERSHIP = '''
+        INSERT INTO members (user_id, join_date, expire_date, is_active, created_at)
+        VALUES (:user_id, :now, :now + :duration, 1, :now)
+        ON CONFLICT (user_id) DO UPDATE SET
+            join_date = excluded.join_date,
+            expire_date = excluded.expire_date,
+            is_active = 1
+    '''
+
+    def complete_payment(self, payment_id: str, status: str, completed_at: int,
+                         days: int = 30) -> Optional[int]:
+        """Ödemeyi tamamlandı olarak işaretle ve üyeliği aynı işlemde ver.
+
+        Yalnızca ilk onayda üyeliğin bitiş zamanını, aksi halde None döndürür.
+        """
+        try:
+            with self._connect() as conn:
+                row = conn.execute('''
+                    UPDATE payments
+                    SET status = ?, completed_at = ?
+                    WHERE payment_id = ? AND completed_at IS NULL
+                    RETURNING telegram_id
+                ''', (status, completed_at, payment_id)).fetchone()
+                if row is None:
+                    conn.commit()
+                    return None
+                conn.execute(self._GRANT_MEMBERSHIP, {
+                    'user_id': row[0], 'now': completed_at, 'duration': days * 86400
+                })
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Ödeme tamamlanırken hata: {e}")
+            return None
+        expire_date = completed_at + days * 86400
+        self._cache_member((row[0], completed_at, expire_date, 1))
+        return expire_date
+
     def update_payment_status(self, payment_id: str,
-                            status: str, completed_at: str = None) -> bool:
+                            status: str, completed_at: int = None) -> bool:
         """Ödeme durumunu güncelle"""
         try:
             with self._connect() as conn:
@@ -161,18 +586,527 @@ class Database:
             logger.error(f"Ödeme durumu güncellenirken hata: {e}")
             return False
 
-    def get_expired_subscriptions(self) -> list:
-        """Süresi dolmuş abonelikleri getir"""
+    def get_unsettled_payments(self, since: int, terminal_statuses: Iterable[str],
+                               after: Tuple[int, str] = (0, ''), limit: int = 500) -> list:
+        """Kesinleşmemiş ödemeleri (payment_id, created_at) olarak, (created_at, payment_id) sırasıyla sayfalı getir"""
+        statuses = list(terminal_statuses)
+        placeholders = ','.join('?' * len(statuses))
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT payment_id, created_at FROM payments
+                WHERE completed_at IS NULL AND status NOT IN ({placeholders})
+                  AND created_at >= ? AND (created_at, payment_id) > (?, ?)
+                ORDER BY created_at, payment_id
+                LIMIT ?
+            ''', (*statuses, since, after[0], after[1], limit))
+            return cursor.fetchall()
+
+    def apply_payment_statuses(self, statuses: Iterable[Tuple[str, str]],
+                               paid_statuses: Iterable[str], completed_at: int,
+                               days: int = 30) -> list:
+        """Sağlayıcıdaki durumları yerel kayıtlarla karşılaştır, değişenleri tek işlemde uygula.
+
+        İlk kez ödenen ödemelerin sahiplerine üyelik aynı işlemde verilir. Değişen
+        ödemeleri (payment_id, telegram_id, status, expire_date) olarak döndürür;
+        expire_date yalnızca üyelik verilen kayıtlarda doludur.
+        """
+        incoming = dict(statuses)
+        paid_statuses = set(paid_statuses)
+        payment_ids = list(incoming)
+        changes = []
+        conn = self._connect()
         try:
-            now = datetime.now().isoformat()
-            with self._connect() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT telegram_id, username, subscription_end_date
-                    FROM users
-                    WHERE subscription_end_date < ?
-                ''', (now,))
-                return cursor.fetchall()
-        except Exception as e:
-            logger.error(f"Süresi dolmuş abonelikler alınırken hata: {e}")
-            return []
+            # Okuma ile yazma arasında başka bir süreç ödemeyi tamamlayamaz
+            conn.execute('BEGIN IMMEDIATE')
+            for i in range(0, len(payment_ids), 500):
+                chunk = payment_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute(f'''
+                    SELECT payment_id, telegram_id, status, completed_at FROM payments
+                    WHERE payment_id IN ({placeholders})
+                ''', chunk).fetchall()
+                for payment_id, telegram_id, status, paid_at in rows:
+                    new_status = incoming[payment_id]
+                    if new_status == status:
+                        continue
+                    newly_paid = paid_at is None and new_status in paid_statuses
+                    expire_date = completed_at + days * 86400 if newly_paid else None
+                    changes.append((payment_id, telegram_id, new_status, expire_date))
+            
+            conn.executemany('''
+                UPDATE payments
+                SET status = ?, completed_at = CASE WHEN ? THEN ? ELSE completed_at END
+                WHERE payment_id = ?
+            ''', [
+                (status, expire_date is not None, completed_at, payment_id)
+                for payment_id, _, status, expire_date in changes
+            ])
+            conn.executemany(self._GRANT_MEMBERSHIP, [
+                {'user_id': telegram_id, 'now': completed_at, 'duration': days * 86400}
+                for _, telegram_id, _, expire_date in changes
+                if expire_date is not None
+            ])
+            conn.commit()
+            for _, telegram_id, _, expire_date in changes:
+                if expire_date is not None:
+                    self._cache_member((telegram_id, completed_at, expire_date, 1))
+            return changes
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if not self.persistent:
+                conn.close()
+
+    def add_member(self, user_id: int, days: int = 30) -> int:
+        """Yeni üye ekle, bitiş zamanını döndür"""
+        join_date = int(time.time())
+        expire_date = join_date + days * 86400
+        
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO members (user_id, join_date, expire_date, is_active, created_at)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    join_date = excluded.join_date,
+                    expire_date = excluded.expire_date,
+                    is_active = 1
+            ''', (user_id, join_date, expire_date, join_date))
+            conn.commit()
+        self._cache_member((user_id, join_date, expire_date, 1))
+        return expire_date
+
+    def bulk_add_members(self, user_ids: Iterable[int], days: int = 30) -> list:
+        """Üyelikleri bugünden başlatarak ver ve bekleyen dekontları onayla (tek işlem),
+        (user_id, expire_date) listesi döndür"""
+        join_date = int(time.time())
+        expire_date = join_date + days * 86400
+        user_ids = list(dict.fromkeys(user_ids))
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO members (user_id, join_date, expire_date, is_active, created_at)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    join_date = excluded.join_date,
+                    expire_date = excluded.expire_date,
+                    is_active = 1
+            ''', [(user_id, join_date, expire_date, join_date) for user_id in user_ids])
+            conn.executemany(
+                "UPDATE receipts SET status = 'approved' WHERE user_id = ? AND status = 'pending'",
+                [(user_id,) for user_id in user_ids]
+            )
+            conn.commit()
+        for user_id in user_ids:
+            self._cache_member((user_id, join_date, expire_date, 1))
+        return [(user_id, expire_date) for user_id in user_ids]
+
+    def bulk_extend_members(self, user_ids: Iterable[int], days: int) -> list:
+        """Üyelikleri tek işlemde uzat (bitmişse bugünden), (user_id, expire_date) listesi döndür"""
+        now = int(time.time())
+        rows = []
+        with self._connect() as conn:
+            for user_id in dict.fromkeys(user_ids):
+                rows.append(conn.execute(
+                    f"{self._UPSERT_SUBSCRIPTION} RETURNING {self._MEMBER_COLUMNS}",
+                    {'telegram_id': user_id, 'username': None, 'now': now, 'duration': int(days) * 86400}
+                ).fetchone())
+            conn.commit()
+        for row in rows:
+            self._cache_member(row)
+        return [(row[0], row[2]) for row in rows]
+
+    def revoke_members(self, user_ids: Iterable[int]) -> list:
+        """Aktif üyelikleri tek işlemde hemen sonlandır, sonlandırılan ID'leri döndür"""
+        user_ids = list(user_ids)
+        now = int(time.time())
+        revoked = []
+        with self._connect() as conn:
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(f'''
+                    UPDATE members SET is_active = 0, expire_date = MIN(expire_date, ?)
+                    WHERE user_id IN ({placeholders}) AND is_active = 1
+                    RETURNING user_id, expire_date
+                ''', (now, *chunk))
+                revoked.extend(cursor.fetchall())
+            conn.commit()
+        for user_id, expire_date in revoked:
+            self.member_cache.update(user_id, is_active=0, expire_date=expire_date)
+        return [user_id for user_id, _ in revoked]
+
+    def get_member(self, user_id: int) -> Optional[Dict]:
+        """Üyelik kaydını getir (önce önbellekten)"""
+        member = self.member_cache.get(user_id)
+        if member is not MISS:
+            return member
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {self._MEMBER_COLUMNS}
+                FROM members
+                WHERE user_id = ?
+            ''', (user_id,))
+            row = cursor.fetchone()
+        
+        if row is None:
+            self.member_cache.put(user_id, None)
+            return None
+        return dict(self._cache_member(row))
+
+    def get_expired_members(self) -> list:
+        """Süresi dolan aktif üyelerin ID'lerini getir"""
+        return [user_id for user_id, _ in self.get_members_expiring_before(int(time.time()))]
+
+    def _cache_member(self, row: Tuple[int, int, int, int]) -> Dict:
+        """(user_id, join_date, expire_date, is_active) satırını önbelleğe yaz"""
+        member = {
+            'user_id': row[0],
+            'join_date': row[1],
+            'expire_date': row[2],
+            'is_active': row[3]
+        }
+        self.member_cache.put(row[0], member)
+        return member
+
+    def get_active_members(self) -> list:
+        """Süresi dolmamış aktif üyeleri (user_id, expire_date) olarak getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, expire_date FROM members
+                WHERE is_active = 1 AND expire_date > ?
+            ''', (int(time.time()),))
+            return cursor.fetchall()
+
+    def get_members_expiring_before(self, until: int) -> list:
+        """Verilen zamandan önce bitecek aktif üyeleri (user_id, expire_date) olarak getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id, expire_date FROM members
+                WHERE is_active = 1 AND expire_date < ?
+            ''', (until,))
+            return cursor.fetchall()
+
+    def deactivate_members(self, user_ids: Iterable[int]) -> list:
+        """Süresi dolmuş üyelikleri tek işlemde pasif yap, pasif yapılan ID'leri döndür"""
+        user_ids = list(user_ids)
+        now = int(time.time())
+        deactivated = []
+        with self._connect() as conn:
+            # SQLite parametre sınırı nedeniyle ID'ler parçalar halinde gönderilir
+            for i in range(0, len(user_ids), 500):
+                chunk = user_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = conn.execute(f'''
+                    UPDATE members SET is_active = 0
+                    WHERE user_id IN ({placeholders})
+                        AND is_active = 1 AND expire_date <= ?
+                    RETURNING user_id
+                ''', (*chunk, now))
+                deactivated.extend(row[0] for row in cursor.fetchall())
+            conn.commit()
+        for user_id in deactivated:
+            self.member_cache.update(user_id, is_active=0)
+        return deactivated
+
+    def add_expiry_retries(self, failures: Iterable[Tuple[int, str, str]], delay: int) -> int:
+        """(user_id, action, error) hatalarını kuyruğa ekle; tekrar edenlerin deneme sayısını artır"""
+        now = int(time.time())
+        params = [
+            {'user_id': user_id, 'action': action, 'error': error, 'now': now, 'delay': delay}
+            for user_id, action, error in failures
+        ]
+        with self._connect() as conn:
+            # Bekleme süresi her denemede iki katına çıkar
+            conn.executemany('''
+                INSERT INTO expiry_retries (user_id, action, attempts, next_attempt_at, last_error)
+                VALUES (:user_id, :action, 1, :now + :delay, :error)
+                ON CONFLICT (user_id, action) DO UPDATE SET
+                    attempts = attempts + 1,
+                    next_attempt_at = :now + :delay * (1 << MIN(attempts, 10)),
+                    last_error = excluded.last_error
+            ''', params)
+            conn.commit()
+        return len(params)
+
+    def claim_due_expiry_retries(self, limit: int = 500, lease: int = 300) -> list:
+        """Zamanı gelen yeniden denemeleri lease süresince sahiplenip (user_id, action, attempts) olarak getir"""
+        now = int(time.time())
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # Sonraki deneme zamanı ileri alınır; aynı anda çalışan başka süreç bu kayıtları almaz,
+            # sahiplenen süreç çökerse kayıtlar lease dolunca yeniden alınır
+            cursor.execute('''
+                UPDATE expiry_retries SET next_attempt_at = ?
+                WHERE (user_id, action) IN (
+                    SELECT user_id, action FROM expiry_retries
+                    WHERE next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING user_id, action, attempts
+            ''', (now + lease, now, limit))
+            rows = cursor.fetchall()
+            conn.commit()
+        return rows
+
+    def delete_expiry_retries(self, items: Iterable[Tuple[int, str]]) -> int:
+        """Tamamlanan veya vazgeçilen (user_id, action) kayıtlarını kuyruktan sil"""
+        params = list(items)
+        with self._connect() as conn:
+            conn.executemany(
+                'DELETE FROM expiry_retries WHERE user_id = ? AND action = ?',
+                params
+            )
+            conn.commit()
+        return len(params)
+
+    def get_sync_cursor(self, name: str) -> Optional[str]:
+        """Kaydedilmiş imleci getir, yoksa None"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT value FROM sync_cursors WHERE name = ?', (name,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def set_sync_cursor(self, name: str, value: str):
+        """İmleci kaydet"""
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO sync_cursors (name, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    value = excluded.value,
+                    updated_at = excluded.updated_at
+            ''', (name, value, int(time.time())))
+            conn.commit()
+
+    def load_state(self, kind: str) -> list:
+        """Bir türdeki tüm durum kayıtlarını (key, data, version) olarak getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT key, data, version FROM bot_state WHERE kind = ?', (kind,))
+            return cursor.fetchall()
+
+    def get_state(self, kind: str, key: str) -> Optional[Tuple[str, int]]:
+        """Tek bir durum kaydını (data, version) olarak getir, yoksa None"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT data, version FROM bot_state WHERE kind = ? AND key = ?',
+                (kind, key)
+            )
+            return cursor.fetchone()
+
+    def save_state(self, rows: Iterable[Tuple[str, str, Optional[str], int]]) -> int:
+        """(kind, key, data, version) kayıtlarını tek işlemde yaz; data None ise kaydı sil"""
+        rows = list(rows)
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT INTO bot_state (kind, key, data, version) VALUES (?, ?, ?, ?)
+                ON CONFLICT (kind, key) DO UPDATE SET
+                    data = excluded.data,
+                    version = excluded.version
+            ''', [row for row in rows if row[2] is not None])
+            conn.executemany(
+                'DELETE FROM bot_state WHERE kind = ? AND key = ?',
+                [(kind, key) for kind, key, data, _ in rows if data is None]
+            )
+            conn.commit()
+        return len(rows)
+
+    def add_invite_links(self, links: Iterable[Tuple[str, int]]) -> int:
+        """Yeni oluşturulan (invite_link, expires_at) bağlantılarını havuza kaydet"""
+        now = int(time.time())
+        params = [(link, now, expires_at) for link, expires_at in links]
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO invite_links (invite_link, created_at, expires_at) VALUES (?, ?, ?)',
+                params
+            )
+            conn.commit()
+        return len(params)
+
+    def get_pooled_invite_links(self, min_expires_at: int) -> list:
+        """Verilmemiş ve yeterince geçerli bağlantıları (invite_link, expires_at) olarak getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT invite_link, expires_at FROM invite_links
+                WHERE user_id IS NULL AND revoked_at IS NULL AND expires_at > ?
+                ORDER BY expires_at
+            ''', (min_expires_at,))
+            return cursor.fetchall()
+
+    def get_stale_invite_links(self, min_expires_at: int) -> list:
+        """Verilmeden geçerliliği azalan bağlantıları getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT invite_link FROM invite_links
+                WHERE user_id IS NULL AND revoked_at IS NULL AND expires_at <= ?
+            ''', (min_expires_at,))
+            return [row[0] for row in cursor.fetchall()]
+
+    def issue_invite_link(self, invite_link: str, user_id: int, payment_id: str = None) -> bool:
+        """Bağlantıyı üyeye verildi olarak işaretle"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE invite_links SET user_id = ?, payment_id = ?, issued_at = ?
+                WHERE invite_link = ? AND user_id IS NULL
+            ''', (user_id, payment_id, int(time.time()), invite_link))
+            conn.commit()
+            return cursor.rowcount > 0
+
+    def revoke_invite_links(self, links: Iterable[str]) -> int:
+        """İptal edilen bağlantıları işaretle"""
+        now = int(time.time())
+        params = [(now, link) for link in links]
+        with self._connect() as conn:
+            conn.executemany(
+                'UPDATE invite_links SET revoked_at = ? WHERE invite_link = ?',
+                params
+            )
+            conn.commit()
+        return len(params)
+
+    def add_receipt(self, user_id: int, file_id: str, file_unique_id: str,
+                    media_type: str, image_hash: Optional[int] = None) -> Tuple[int, Optional[Dict]]:
+        """Dekontu inceleme kuyruğuna ekle, (receipt_id, daha önceki aynı dekont) döndür"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            original = conn.execute('''
+                SELECT id, user_id, status FROM receipts
+                WHERE file_unique_id = ? AND duplicate_of IS NULL
+                LIMIT 1
+            ''', (file_unique_id,)).fetchone()
+            if original is None and image_hash is not None:
+                original = conn.execute('''
+                    SELECT id, user_id, status FROM receipts
+                    WHERE image_hash = ? AND duplicate_of IS NULL
+                    LIMIT 1
+                ''', (image_hash,)).fetchone()
+            cursor = conn.execute('''
+                INSERT INTO receipts (user_id, file_id, file_unique_id, media_type,
+                                      image_hash, duplicate_of, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, file_id, file_unique_id, media_type, image_hash,
+                  original[0] if original else None, int(time.time())))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if not self.persistent:
+                conn.close()
+        if original is None:
+            return cursor.lastrowid, None
+        return cursor.lastrowid, {'id': original[0], 'user_id': original[1], 'status': original[2]}
+
+    def get_receipt(self, receipt_id: int) -> Optional[Dict]:
+        """Dekont kaydını getir"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, user_id, file_id, media_type, duplicate_of, status, created_at
+                FROM receipts WHERE id = ?
+            ''', (receipt_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip(
+            ('id', 'user_id', 'file_id', 'media_type', 'duplicate_of', 'status', 'created_at'), row
+        ))
+
+    def claim_undigested_receipts(self, limit: int = 100) -> list:
+        """Özete henüz girmemiş dekontları tek işlemde özete alındı olarak işaretle ve
+        tekrar ettikleri dekontun sahibiyle birlikte getir; aynı dekontu iki süreç alamaz"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            claimed = [row[0] for row in cursor.execute('''
+                UPDATE receipts SET digested_at = ?
+                WHERE id IN (
+                    SELECT id FROM receipts WHERE digested_at IS NULL ORDER BY id LIMIT ?
+                )
+                RETURNING id
+            ''', (int(time.time()), limit)).fetchall()]
+            if not claimed:
+                conn.commit()
+                return []
+            placeholders = ','.join('?' * len(claimed))
+            cursor.execute(f'''
+                SELECT r.id, r.user_id, r.media_type, r.created_at, r.duplicate_of,
+                       o.user_id, o.status
+                FROM receipts r
+                LEFT JOIN receipts o ON o.id = r.duplicate_of
+                WHERE r.id IN ({placeholders})
+                ORDER BY r.id
+            ''', claimed)
+            rows = cursor.fetchall()
+            conn.commit()
+            return [
+                dict(zip(
+                    ('id', 'user_id', 'media_type', 'created_at', 'duplicate_of',
+                     'original_user_id', 'original_status'),
+                    row
+                ))
+                for row in rows
+            ]
+
+    def release_receipts(self, receipt_ids: Iterable[int]) -> int:
+        """Özeti gönderilemeyen dekontları sonraki tur için geri bırak"""
+        params = [(receipt_id,) for receipt_id in receipt_ids]
+        with self._connect() as conn:
+            conn.executemany('UPDATE receipts SET digested_at = NULL WHERE id = ?', params)
+            conn.commit()
+        return len(params)
+
+    def resolve_receipts(self, user_ids: Iterable[int], status: str) -> int:
+        """Kullanıcıların bekleyen dekontlarını sonuçlandır"""
+        params = [(status, user_id) for user_id in user_ids]
+        with self._connect() as conn:
+            cursor = conn.executemany(
+                "UPDATE receipts SET status = ? WHERE user_id = ? AND status = 'pending'",
+                params
+            )
+            conn.commit()
+            return cursor.rowcount
+
+class AsyncDatabase:
+    """Senkron bir depoyu tek bir arka plan iş parçacığında çalıştıran async sarmalayıcı.
+
+    Depo bu iş parçacığında oluşturulur ve tüm sorgular aynı kalıcı bağlantıdan
+    geçer; böylece disk işlemleri event loop'u bloklamaz.
+    """
+
+    def __init__(self, store_class, *args, **kwargs):
+        kwargs.setdefault('persistent', True)
+        self._executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix=store_class.__name__
+        )
+        self._store = self._executor.submit(store_class, *args, **kwargs).result()
+
+    def __getattr__(self, name):
+        attr = getattr(self._store, name)
+        if not callable(attr):
+            return attr
+        
+        async def method(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(attr, *args, **kwargs)
+            )
+        return method
+
+    async def close(self):
+        """Bağlantıyı kapat ve iş parçacığını durdur"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._store.close)
+        self._executor.shutdown(wait=False)
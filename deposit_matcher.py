@@ -0,0 +1,205 @@
+import os
+import json
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Tron ana ağındaki USDT (TRC-20) sözleşmesi
+USDT_TRC20_CONTRACT = 'TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t'
+
+class JsonlTransferFeed:
+    """Her satırı bir transfer olan JSONL dosyasından okuyan kaynak (yerel test düğümü).
+
+    Satır biçimi: {"txid": ..., "to": ..., "amount": 30.01, "timestamp": ...}
+    İmleç dosyadaki bayt konumudur; yarım yazılmış son satır bir sonraki okumaya kalır.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.getenv('DEPOSIT_FEED_PATH', 'deposits.jsonl')
+
+    async def fetch(self, cursor: str, limit: int) -> tuple:
+        """İmleçten sonraki en fazla limit transferi ve yeni imleci döndür"""
+        return await asyncio.to_thread(self._read, int(cursor or 0), limit)
+
+    def _read(self, offset: int, limit: int) -> tuple:
+        if not os.path.exists(self.path):
+            return [], str(offset)
+
+        transfers = []
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while len(transfers) < limit:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                    transfers.append({
+                        'txid': data['txid'],
+                        'to': data['to'],
+                        'amount': float(data['amount']),
+                        'timestamp': data.get('timestamp')
+                    })
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Geçersiz transfer satırı atlandı: {line[:200]!r}, Hata: {str(e)}")
+        return transfers, str(offset)
+
+class TronGridTransferFeed:
+    """Cüzdana gelen onaylı USDT transferlerini TronGrid API'sinden okuyan kaynak.
+
+    İmleç son görülen blok zamanıdır (ms); aynı zamandaki transferler tekrar
+    döndürülebilir, tekrarları DepositMatcher ayıklar.
+    """
+
+    def __init__(self, address: str, session: aiohttp.ClientSession = None):
+        self.address = address
+        self.api_url = os.getenv('TRONGRID_API_URL', 'https://api.trongrid.io')
+        self.api_key = os.getenv('TRONGRID_API_KEY')
+        self.contract = os.getenv('USDT_TRC20_CONTRACT', USDT_TRC20_CONTRACT)
+        self._session = session
+
+    async def fetch(self, cursor: str, limit: int) -> tuple:
+        """İmleçten sonraki en fazla limit transferi ve yeni imleci döndür"""
+        if self._session is None or self._session.closed:
+            headers = {'TRON-PRO-API-KEY': self.api_key} if self.api_key else {}
+            self._session = aiohttp.ClientSession(
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=15)
+            )
+
+        params = {
+            'only_to': 'true',
+            'only_confirmed': 'true',
+            'contract_address': self.contract,
+            'order_by': 'block_timestamp,asc',
+            'limit': limit
+        }
+        if cursor:
+            params['min_timestamp'] = cursor
+
+        url = f"{self.api_url}/v1/accounts/{self.address}/transactions/trc20"
+        async with self._session.get(url, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
+
+        transfers = []
+        for item in data.get('data', []):
+            decimals = int(item.get('token_info', {}).get('decimals', 6))
+            transfers.append({
+                'txid': item['transaction_id'],
+                'to': item['to'],
+                'amount': int(item['value']) / 10 ** decimals,
+                'timestamp': item['block_timestamp']
+            })
+        next_cursor = str(transfers[-1]['timestamp']) if transfers else cursor
+        return transfers, next_cursor
+
+    async def close(self):
+        """HTTP oturumunu kapat"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+def create_transfer_feed(address: str):
+    """DEPOSIT_FEED ayarına göre transfer kaynağını oluştur"""
+    source = os.getenv('DEPOSIT_FEED', 'jsonl')
+    if source == 'trongrid':
+        return TronGridTransferFeed(address)
+    if source == 'jsonl':
+        return JsonlTransferFeed()
+    raise ValueError(f"Bilinmeyen transfer kaynağı: {source}")
+
+class DepositMatcher:
+    """Transfer akışını imleçle artımlı okuyup her transferi bekleyen USDT ödemesine eşler.
+
+    Eşleme ManualUSDTProcessor'ın tutar indeksi üzerinden yapılır; bekleyen ödeme
+    sayısından bağımsız olarak transfer başına O(1)'dir. İmleç her partiden sonra
+    veritabanına yazılır, yeniden başlatmada kaldığı yerden devam edilir.
+    """
+
+    def __init__(self, processor, feed, on_match, db=None, batch_size: int = None,
+                 cursor_name: str = 'trc20_deposits'):
+        self.processor = processor
+        self.feed = feed
+        self.on_match = on_match  # async (bot, payment, transfer)
+        self.db = db
+        self.batch_size = batch_size or int(os.getenv('DEPOSIT_BATCH_SIZE', 200))
+        self.cursor_name = cursor_name
+        self.matched = 0
+        self.unmatched = 0
+        self._cursor = None
+        self._cursor_loaded = False
+        self._lock = asyncio.Lock()
+        # İmleç sınırında tekrar gelen transferleri ayıklamak için son görülenler
+        self._seen = set()
+        self._seen_order = deque()
+
+    def start(self, job_queue):
+        """Akışı DEPOSIT_POLL_SECONDS aralıklarla okuyan işi başlat"""
+        job_queue.run_repeating(
+            self.poll,
+            interval=timedelta(seconds=int(os.getenv('DEPOSIT_POLL_SECONDS', 15))),
+            first=timedelta(seconds=5)
+        )
+
+    async def poll(self, context) -> None:
+        """Yeni transferleri oku ve eşle (job queue callback'i)"""
+        if self._lock.locked():
+            return
+        async with self._lock:
+            try:
+                await self._drain(context.bot)
+            except Exception as e:
+                logger.error(f"Transfer akışı okunurken hata: {str(e)}")
+
+    async def _drain(self, bot):
+        if not self._cursor_loaded:
+            if self.db is not None:
+                self._cursor = await self.db.get_sync_cursor(self.cursor_name)
+            self._cursor_loaded = True
+
+        while True:
+            transfers, next_cursor = await self.feed.fetch(self._cursor, self.batch_size)
+            for transfer in transfers:
+                await self._handle(bot, transfer)
+
+            if next_cursor == self._cursor:
+                break
+            self._cursor = next_cursor
+            if self.db is not None:
+                await self.db.set_sync_cursor(self.cursor_name, next_cursor)
+            if len(transfers) < self.batch_size:
+                break
+
+    async def _handle(self, bot, transfer: dict):
+        txid = transfer['txid']
+        if txid in self._seen:
+            return
+        self._remember(txid)
+
+        if transfer['to'] != self.processor.wallet_address:
+            return
+
+        payment = self.processor.match_deposit(transfer['amount'], txid)
+        if payment is None:
+            self.unmatched += 1
+            logger.warning(f"Eşleşmeyen USDT transferi - TX: {txid}, Tutar: {transfer['amount']}")
+            return
+
+        self.matched += 1
+        try:
+            await self.on_match(bot, payment, transfer)
+        except Exception as e:
+            logger.error(f"Eşlenen ödeme işlenirken hata - Payment ID: {payment.payment_id}, Hata: {str(e)}")
+
+    def _remember(self, txid: str):
+        self._seen.add(txid)
+        self._seen_order.append(txid)
+        if len(self._seen_order) > self.batch_size * 10:
+            self._seen.discard(self._seen_order.popleft())
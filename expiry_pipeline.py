@@ -0,0 +1,133 @@
+import os
+import asyncio
+import logging
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from rate_limiter import RateLimiter
+from message_dispatcher import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+EXPIRED_MESSAGE = "⚠️ VIP üyelik süreniz dolmuştur. Yenilemek için /start komutunu kullanabilirsiniz."
+REVOKED_MESSAGE = "⚠️ VIP üyeliğiniz yönetici tarafından sonlandırılmıştır. Sorularınız için yöneticiyle iletişime geçebilirsiniz."
+
+# Üyelik sonlandırılırken her kullanıcı için uygulanan adımlar
+KICK = 'kick'
+NOTIFY = 'notify'
+NOTIFY_REVOKED = 'notify_revoked'
+
+# Bildirim adımlarının gönderdiği metinler (yeniden denemelerde de aynı metin gider)
+NOTICES = {
+    NOTIFY: EXPIRED_MESSAGE,
+    NOTIFY_REVOKED: REVOKED_MESSAGE,
+}
+
+class ExpiryPipeline:
+    """Süresi dolan üyelikleri toplu olarak sonlandırır.
+
+    Üyelikler tek kısa işlemde pasif yapılır, ardından gruptan çıkarma ve
+    bildirim çağrıları hız sınırı altında eşzamanlı yapılır. Başarısız adımlar
+    veritabanındaki yeniden deneme kuyruğuna yazılır.
+    """
+
+    def __init__(self, db, group_id=None, rate_limiter: RateLimiter = None, dispatcher=None,
+                 on_expired=None):
+        self.db = db
+        self.dispatcher = dispatcher  # Varsa bildirimler toplu öncelikle bu kuyruktan gider
+        self.on_expired = on_expired  # (user_ids), pasif yapılan üyeler için bellek içi önbellekleri günceller
+        self.group_id = group_id or os.getenv('TELEGRAM_GROUP_ID')
+        self.rate_limiter = rate_limiter or RateLimiter(float(os.getenv('EXPIRY_RATE_PER_SECOND', 20)))
+        self.batch_size = int(os.getenv('EXPIRY_BATCH_SIZE', 500))
+        self.retry_delay = int(os.getenv('EXPIRY_RETRY_DELAY_SECONDS', 60))
+        self.max_attempts = int(os.getenv('EXPIRY_RETRY_MAX_ATTEMPTS', 8))
+        self.retry_lease = int(os.getenv('EXPIRY_RETRY_LEASE_SECONDS', 300))
+
+    async def expire(self, bot, user_ids: list) -> dict:
+        """Verilen üyelikleri sonlandır, özet döndür"""
+        summary = {'expired': 0, 'failed': 0}
+        user_ids = list(user_ids)
+        for i in range(0, len(user_ids), self.batch_size):
+            expired = await self.db.deactivate_members(user_ids[i:i + self.batch_size])
+            if not expired:
+                continue
+            if self.on_expired:
+                self.on_expired(expired)
+            
+            failed = await self.remove(bot, expired)
+            summary['expired'] += len(expired)
+            summary['failed'] += failed
+            logger.info(f"{len(expired)} üyelik sonlandırıldı, {failed} adım yeniden denenecek")
+        return summary
+
+    async def remove(self, bot, user_ids: list, notify: str = NOTIFY) -> int:
+        """Pasif yapılmış üyeleri gruptan çıkar ve bilgilendir, yeniden denenecek adım sayısını döndür"""
+        results = await asyncio.gather(*(
+            self._run_action(bot, user_id, action)
+            for user_id in user_ids
+            for action in (KICK, notify)
+        ))
+        failures = [failure for failure in results if failure]
+        if failures:
+            await self.db.add_expiry_retries(failures, self.retry_delay)
+        return len(failures)
+
+    async def retry_due(self, context) -> None:
+        """Zamanı gelen başarısız adımları yeniden dene (job queue callback'i)"""
+        due = await self.db.claim_due_expiry_retries(self.batch_size, self.retry_lease)
+        if not due:
+            return
+        
+        results = await asyncio.gather(*(
+            self._run_action(context.bot, user_id, action)
+            for user_id, action, _ in due
+        ))
+        
+        done = []
+        failures = []
+        for (user_id, action, attempts), failure in zip(due, results):
+            if not failure:
+                done.append((user_id, action))
+            elif attempts >= self.max_attempts:
+                logger.error(f"Üyelik sonlandırma adımı vazgeçildi - User ID: {user_id}, Adım: {action}")
+                done.append((user_id, action))
+            else:
+                failures.append(failure)
+        
+        if done:
+            await self.db.delete_expiry_retries(done)
+        if failures:
+            await self.db.add_expiry_retries(failures, self.retry_delay)
+        logger.info(f"Yeniden deneme: {len(due)} adım, {len(failures)} başarısız")
+
+    async def _run_action(self, bot, user_id: int, action: str):
+        """Tek adımı uygula; yeniden denenecekse (user_id, action, hata) döndür"""
+        try:
+            if action == KICK:
+                if not self.group_id:
+                    return None
+                # Ban + unban kullanıcıyı kalıcı olarak engellemeden gruptan çıkarır
+                async with self.rate_limiter:
+                    await bot.ban_chat_member(chat_id=self.group_id, user_id=user_id)
+                async with self.rate_limiter:
+                    await bot.unban_chat_member(
+                        chat_id=self.group_id,
+                        user_id=user_id,
+                        only_if_banned=True
+                    )
+            elif self.dispatcher is not None:
+                await self.dispatcher.send_message(user_id, NOTICES[action], PRIORITY_BULK)
+            else:
+                async with self.rate_limiter:
+                    await bot.send_message(chat_id=user_id, text=NOTICES[action])
+            return None
+        except (Forbidden, BadRequest) as e:
+            # Botu engelleyen veya grupta olmayan kullanıcılar için tekrar denemek anlamsız
+            logger.warning(f"Üyelik sonlandırma adımı atlandı - User ID: {user_id}, Adım: {action}, Hata: {e}")
+            return None
+        except RetryAfter as e:
+            logger.warning(f"Telegram hız sınırı - {e.retry_after} saniye sonra tekrar denenecek")
+            if action == KICK:
+                self.rate_limiter.pause(e.retry_after)
+            return (user_id, action, str(e))
+        except Exception as e:
+            logger.error(f"Üyelik sonlandırma hatası - User ID: {user_id}, Adım: {action}, Hata: {e}")
+            return (user_id, action, str(e))
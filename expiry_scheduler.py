@@ -0,0 +1,103 @@
+import os
+import math
+import time
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """Yaklaşan üyelik bitişlerini min-heap'te tutar ve bitiş anına yakın tetiklenir.
+
+    Heap yalnızca önümüzdeki `horizon` saniye içinde bitecek üyeleri içerir ve
+    veritabanından bu pencere kadar tembel yüklenir. Aynı `bucket` aralığına
+    düşen bitişler tek seferde işlenir.
+    """
+
+    def __init__(self, db, on_expire, bucket_seconds: int = None, horizon_seconds: int = None):
+        self.db = db
+        self.on_expire = on_expire  # async (bot, user_ids)
+        self.bucket = bucket_seconds or int(os.getenv('EXPIRY_BUCKET_SECONDS', 60))
+        self.horizon = horizon_seconds or int(os.getenv('EXPIRY_HORIZON_SECONDS', 3600))
+        self._heap = []  # (expire_at, user_id)
+        self._expiries = {}  # user_id -> güncel expire_at, eski heap kayıtları bununla ayıklanır
+        self._loaded_until = 0
+        self._job_queue = None
+        self._job = None
+        self._next_run = None
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def start(self, job_queue):
+        """İlk yüklemeyi hemen yapacak şekilde zamanlayıcıyı başlat"""
+        self._job_queue = job_queue
+        self._wake_at(time.time())
+
+    def schedule(self, user_id: int, expire_at: int):
+        """Üyenin bitiş zamanını ekle veya güncelle"""
+        if expire_at > self._loaded_until:
+            # Pencere dışındaki bitiş sonraki yüklemede veritabanından gelir
+            self._expiries.pop(user_id, None)
+            return
+        self._expiries[user_id] = expire_at
+        heapq.heappush(self._heap, (expire_at, user_id))
+        self._wake_at(self._bucket_end(expire_at))
+
+    def cancel(self, user_id: int):
+        """Üyeyi takipten çıkar"""
+        self._expiries.pop(user_id, None)
+
+    def _bucket_end(self, timestamp: float) -> float:
+        return math.ceil(timestamp / self.bucket) * self.bucket
+
+    def _wake_at(self, when: float):
+        """Sonraki çalışmayı daha erken bir zamana çek"""
+        if self._job_queue is None:
+            return
+        if self._next_run is not None and self._next_run <= when:
+            return
+        if self._job is not None:
+            self._job.schedule_removal()
+        self._next_run = when
+        self._job = self._job_queue.run_once(self._run, when=max(when - time.time(), 0))
+
+    async def _load(self, now: float):
+        """Pencere içinde bitecek aktif üyeleri veritabanından yükle"""
+        until = int(now) + self.horizon
+        rows = await self.db.get_members_expiring_before(until)
+        for user_id, expire_at in rows:
+            if self._expiries.get(user_id) != expire_at:
+                self._expiries[user_id] = expire_at
+                heapq.heappush(self._heap, (expire_at, user_id))
+        self._loaded_until = until
+        logger.info(f"Bitiş zamanlayıcısı yüklendi - {len(rows)} üye, pencere sonu: {until}")
+
+    async def _run(self, context):
+        """Zamanı gelen üyelikleri işle ve bir sonraki uyanmayı planla"""
+        self._job = None
+        self._next_run = None
+        now = time.time()
+        
+        try:
+            if now >= self._loaded_until - self.bucket:
+                await self._load(now)
+            
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                expire_at, user_id = heapq.heappop(self._heap)
+                # Üyelik uzatıldıysa heap'teki eski kayıt atlanır
+                if self._expiries.get(user_id) == expire_at:
+                    del self._expiries[user_id]
+                    due.append(user_id)
+            
+            if due:
+                logger.info(f"{len(due)} üyeliğin süresi doldu")
+                await self.on_expire(context.bot, due)
+        except Exception as e:
+            logger.error(f"Bitiş zamanlayıcısı hatası: {str(e)}", exc_info=True)
+        finally:
+            next_run = self._loaded_until
+            if self._heap:
+                next_run = min(next_run, self._bucket_end(self._heap[0][0]))
+            self._wake_at(max(next_run, time.time() + 1))
@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+import time
+import secrets
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FEED_PATH = os.getenv('DEPOSIT_FEED_PATH', 'deposits.jsonl')
+WALLET_ADDRESS = os.getenv('USDT_WALLET_ADDRESS', 'YOUR_WALLET_ADDRESS')
+
+def append_fake_deposit(amount: float):
+    """Yerel transfer akışı dosyasına sahte bir USDT transferi ekle"""
+    transfer = {
+        "txid": secrets.token_hex(32),
+        "to": WALLET_ADDRESS,
+        "amount": amount,
+        "timestamp": int(time.time() * 1000)
+    }
+    with open(FEED_PATH, 'a') as f:
+        f.write(json.dumps(transfer) + '\n')
+    
+    print(f"Akış dosyası: {FEED_PATH}")
+    print(f"Transfer: {json.dumps(transfer, indent=2)}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Kullanım: python fake_deposit.py <amount>")
+        sys.exit(1)
+    append_fake_deposit(float(sys.argv[1]))
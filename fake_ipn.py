@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import asyncio
+import aiohttp
+from dotenv import load_dotenv
+from ipn_server import sign_ipn_payload
+
+load_dotenv()
+
+IPN_SECRET = os.getenv('NOWPAYMENTS_IPN_SECRET')
+IPN_URL = f"http://127.0.0.1:{os.getenv('IPN_PORT', 8080)}{os.getenv('IPN_PATH', '/nowpayments/ipn')}"
+
+async def send_fake_ipn(payment_id: str, status: str):
+    """Yerel IPN sunucusuna imzalı sahte bildirim gönder"""
+    payload = {
+        "payment_id": int(payment_id) if payment_id.isdigit() else payment_id,
+        "payment_status": status,
+        "pay_address": "TEST_BTC_ADDRESS",
+        "price_amount": float(os.getenv('MINIMUM_PAYMENT_USD', 30)),
+        "price_currency": "usd",
+        "pay_amount": 0.001,
+        "actually_paid": 0.001 if status in ('confirmed', 'finished') else 0,
+        "pay_currency": "btc",
+        "order_description": "Telegram Grup Erişimi"
+    }
+    headers = {'x-nowpayments-sig': sign_ipn_payload(payload, IPN_SECRET)}
+    
+    print(f"IPN URL: {IPN_URL}")
+    print(f"Payload: {json.dumps(payload, indent=2)}")
+    
+    async with aiohttp.ClientSession() as session:
+        async with session.post(IPN_URL, json=payload, headers=headers) as response:
+            print(f"Status Code: {response.status}")
+            print(f"Response: {await response.text()}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Kullanım: python fake_ipn.py <payment_id> [status]")
+        sys.exit(1)
+    if not IPN_SECRET:
+        print("NOWPAYMENTS_IPN_SECRET tanımlı değil")
+        sys.exit(1)
+    asyncio.run(send_fake_ipn(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else 'finished'))
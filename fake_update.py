@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import asyncio
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+WEBHOOK_URL = f"http://127.0.0.1:{os.getenv('TELEGRAM_WEBHOOK_PORT', 8443)}/{os.getenv('TELEGRAM_WEBHOOK_PATH', 'telegram')}"
+
+def build_update(update_id: int, chat_id: int, text: str) -> dict:
+    """Özel sohbetten gelen bir metin mesajı güncellemesi oluştur"""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Test", "username": f"test{chat_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private", "first_name": "Test"},
+        "from": user,
+        "text": text
+    }
+    if text.startswith('/'):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+async def send_fake_updates(chat_count: int, text: str, per_chat: int):
+    """Yerel webhook dinleyicisine sahte güncellemeleri eşzamanlı gönder"""
+    headers = {'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET} if WEBHOOK_SECRET else {}
+    update_id = int(time.time())
+    
+    print(f"Webhook URL: {WEBHOOK_URL}")
+    
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def post(update: dict):
+            async with session.post(WEBHOOK_URL, json=update) as response:
+                return response.status
+        
+        updates = []
+        for n in range(per_chat):
+            for chat_id in range(1, chat_count + 1):
+                update_id += 1
+                updates.append(build_update(update_id, chat_id, text))
+        
+        started = time.monotonic()
+        statuses = await asyncio.gather(*(post(update) for update in updates))
+        elapsed = time.monotonic() - started
+        
+        print(f"Gönderilen: {len(updates)}, Başarılı: {statuses.count(200)}, Süre: {elapsed:.2f} sn")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Kullanım: python fake_update.py <chat_count> [text] [per_chat]")
+        sys.exit(1)
+    asyncio.run(send_fake_updates(
+        int(sys.argv[1]),
+        sys.argv[2] if len(sys.argv) > 2 else '/start',
+        int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    ))
@@ -0,0 +1,119 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from telegram.error import BadRequest
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class InvitePool:
+    """Önceden oluşturulmuş tek kullanımlık (member_limit=1) davet bağlantıları havuzu.
+
+    Ödeme onaylandığında bağlantı havuzdan O(1) ile alınır, Bot API çağrısı
+    beklenmez. Hangi bağlantının hangi üyeye verildiği invite_links tablosunda
+    tutulur. Arka plan işi havuzu doldurur ve verilmeden geçerliliği azalan
+    bağlantıları iptal eder.
+    """
+
+    def __init__(self, db, group_id: str = None, size: int = None, rate_limiter: RateLimiter = None):
+        self.db = db
+        self.group_id = group_id or os.getenv('TELEGRAM_GROUP_ID')
+        self.size = size or int(os.getenv('INVITE_POOL_SIZE', 20))
+        self.ttl = int(os.getenv('INVITE_LINK_TTL_HOURS', 24)) * 3600
+        # Kullanıcının katılmaya vakti kalmayacak bağlantılar verilmez
+        self.min_remaining = int(os.getenv('INVITE_LINK_MIN_REMAINING_MINUTES', 60)) * 60
+        self.rate_limiter = rate_limiter or RateLimiter(float(os.getenv('INVITE_CREATE_RATE', 1)))
+        self._links = deque()  # (invite_link, expires_at), bitiş sırasına göre
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._links)
+
+    def start(self, job_queue):
+        """Havuzu dolduran ve eski bağlantıları iptal eden işi başlat"""
+        job_queue.run_repeating(
+            self.refill,
+            interval=timedelta(seconds=int(os.getenv('INVITE_REFILL_SECONDS', 60))),
+            first=timedelta(seconds=1)
+        )
+
+    async def take(self, bot, user_id: int, payment_id: str = None) -> str:
+        """Üyeye havuzdan bir bağlantı ver; havuz boşsa yenisini oluştur"""
+        min_expires_at = time.time() + self.min_remaining
+        while self._links:
+            invite_link, expires_at = self._links.popleft()
+            if expires_at <= min_expires_at:
+                # İptal işlemini refill yapar
+                continue
+            # Başka bir süreç aynı bağlantıyı vermiş olabilir
+            if await self.db.issue_invite_link(invite_link, user_id, payment_id):
+                return invite_link
+
+        logger.warning("Davet bağlantısı havuzu boş, bağlantı anında oluşturuluyor")
+        try:
+            invite_link, expires_at = await self._create(bot)
+            await self.db.add_invite_links([(invite_link, expires_at)])
+            await self.db.issue_invite_link(invite_link, user_id, payment_id)
+            return invite_link
+        except Exception as e:
+            logger.error(f"Davet bağlantısı oluşturulamadı, sabit bağlantı kullanılıyor: {str(e)}")
+            return os.getenv('TELEGRAM_GROUP_INVITE_LINK')
+
+    async def refill(self, context) -> None:
+        """Eski bağlantıları iptal et ve havuzu hedef boyuta tamamla (job queue callback'i)"""
+        if self._lock.locked():
+            return
+        async with self._lock:
+            bot = context.bot
+            min_expires_at = int(time.time()) + self.min_remaining
+            if not self._loaded:
+                self._links.extend(await self.db.get_pooled_invite_links(min_expires_at))
+                self._loaded = True
+
+            await self._revoke_stale(bot, min_expires_at)
+            while self._links and self._links[0][1] <= min_expires_at:
+                self._links.popleft()
+
+            created = []
+            for _ in range(self.size - len(self._links)):
+                try:
+                    created.append(await self._create(bot))
+                except Exception as e:
+                    logger.error(f"Davet bağlantısı oluşturulamadı: {str(e)}")
+                    break
+            if created:
+                await self.db.add_invite_links(created)
+                self._links.extend(created)
+                logger.info(f"{len(created)} davet bağlantısı oluşturuldu, havuz: {len(self._links)}")
+
+    async def _create(self, bot) -> tuple:
+        async with self.rate_limiter:
+            expires_at = int(time.time()) + self.ttl
+            link = await bot.create_chat_invite_link(
+                self.group_id,
+                expire_date=expires_at,
+                member_limit=1
+            )
+        return link.invite_link, expires_at
+
+    async def _revoke_stale(self, bot, min_expires_at: int):
+        """Verilmeden geçerliliği azalan bağlantıları iptal et"""
+        revoked = []
+        for invite_link in await self.db.get_stale_invite_links(min_expires_at):
+            try:
+                async with self.rate_limiter:
+                    await bot.revoke_chat_invite_link(self.group_id, invite_link)
+                revoked.append(invite_link)
+            except BadRequest:
+                # Süresi dolmuş veya zaten iptal edilmiş
+                revoked.append(invite_link)
+            except Exception as e:
+                logger.error(f"Davet bağlantısı iptal edilemedi: {str(e)}")
+                break
+        if revoked:
+            await self.db.revoke_invite_links(revoked)
+            logger.info(f"{len(revoked)} kullanılmayan davet bağlantısı iptal edildi")
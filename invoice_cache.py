@@ -0,0 +1,93 @@
+import os
+import time
+import asyncio
+import logging
+from payment_processor import OPEN_STATUSES
+
+logger = logging.getLogger(__name__)
+
+class InvoiceCache:
+    """Kullanıcı başına açık NowPayments faturasını tutar, tekrar isteklerde aynısını döndürür.
+
+    Bellekteki indeks kaçırırsa fatura veritabanından okunur; böylece yeniden
+    başlatmada da aynı adres gösterilir. Aynı kullanıcının eşzamanlı istekleri
+    tek bir fatura oluşturma çağrısını paylaşır. Ödemeye vakit kalmayacak kadar
+    az süresi kalan faturalar tekrar gösterilmez, yenisi oluşturulur.
+    """
+
+    def __init__(self, processor, db):
+        self.processor = processor
+        self.db = db
+        self.min_remaining = int(os.getenv('INVOICE_MIN_REMAINING_MINUTES', 5)) * 60
+        self.write_attempts = int(os.getenv('INVOICE_WRITE_ATTEMPTS', 3))
+        self._by_user = {}  # user_id -> invoice
+        self._users = {}  # payment_id -> user_id
+        self._tasks = {}  # user_id -> asyncio.Task
+
+    async def get_or_create(self, user_id: int, amount_usd: float) -> dict:
+        """Kullanıcının açık faturasını getir, yoksa yenisini oluştur ve kaydet"""
+        invoice = self._by_user.get(user_id)
+        if invoice is not None and invoice['expires_at_ts'] > time.time() + self.min_remaining:
+            return dict(invoice, reused=True)
+
+        task = self._tasks.get(user_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._load_or_create(user_id, amount_usd))
+            self._tasks[user_id] = task
+            task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    def discard(self, payment_id: str):
+        """Ödendiği veya kapandığı için faturayı indeksten çıkar"""
+        user_id = self._users.pop(str(payment_id), None)
+        if user_id is not None:
+            self._by_user.pop(user_id, None)
+
+    async def _load_or_create(self, user_id: int, amount_usd: float) -> dict:
+        payment = await self.db.get_open_payment(
+            user_id, OPEN_STATUSES, int(time.time()) + self.min_remaining
+        )
+        if payment is not None:
+            invoice = {
+                'success': True,
+                'payment_id': payment['payment_id'],
+                'wallet_address': payment['pay_address'],
+                'amount_btc': payment['pay_amount'],
+                'amount_usd': payment['amount'],
+                'expires_at_ts': payment['expires_at']
+            }
+            self._remember(user_id, invoice)
+            return dict(invoice, reused=True)
+
+        result = await self.processor.create_payment(amount_usd)
+        if not result or not result.get('success'):
+            return result
+
+        payment_id = str(result['payment_id'])
+        # Kaydı olmayan ödeme IPN ve uzlaştırmada kullanıcıya eşlenemez; adres
+        # ancak kayıt yazıldıktan sonra gösterilir
+        for attempt in range(1, self.write_attempts + 1):
+            if await self.db.add_payment(
+                payment_id,
+                user_id,
+                result['amount_usd'],
+                pay_address=result['wallet_address'],
+                pay_amount=str(result['amount_btc']),
+                expires_at=result['expires_at_ts']
+            ):
+                break
+            if attempt < self.write_attempts:
+                await asyncio.sleep(0.2 * attempt)
+        else:
+            logger.error(f"Fatura kaydedilemedi, kullanıcıya gösterilmedi - User ID: {user_id}, Payment ID: {payment_id}")
+            return {'success': False, 'error': 'Ödeme kaydı oluşturulamadı'}
+        self._remember(user_id, result)
+        logger.info(f"Yeni fatura oluşturuldu - User ID: {user_id}, Payment ID: {payment_id}")
+        return dict(result, reused=False)
+
+    def _remember(self, user_id: int, invoice: dict):
+        previous = self._by_user.get(user_id)
+        if previous is not None:
+            self._users.pop(str(previous['payment_id']), None)
+        self._by_user[user_id] = invoice
+        self._users[str(invoice['payment_id'])] = user_id
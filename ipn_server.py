@@ -0,0 +1,74 @@
+import os
+import hmac
+import json
+import hashlib
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+def sign_ipn_payload(payload: dict, secret: str) -> str:
+    """NowPayments IPN imzasını hesapla (anahtarları sıralı JSON üzerinden HMAC-SHA512)"""
+    message = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hmac.new(secret.encode(), message.encode(), hashlib.sha512).hexdigest()
+
+def verify_ipn_signature(payload: dict, signature: str, secret: str) -> bool:
+    """Gelen IPN imzasını doğrula"""
+    if not signature or not secret:
+        return False
+    return hmac.compare_digest(sign_ipn_payload(payload, secret), signature)
+
+class IPNServer:
+    """NowPayments IPN bildirimlerini dinleyen gömülü HTTP sunucusu"""
+
+    def __init__(self, on_status_change, secret: str = None, host: str = None,
+                 port: int = None, path: str = None):
+        self.on_status_change = on_status_change  # async (payment_id, status, payload)
+        self.secret = secret or os.getenv('NOWPAYMENTS_IPN_SECRET')
+        self.host = host or os.getenv('IPN_HOST', '0.0.0.0')
+        self.port = port or int(os.getenv('IPN_PORT', 8080))
+        self.path = path or os.getenv('IPN_PATH', '/nowpayments/ipn')
+        self._runner = None
+
+    async def start(self):
+        """Sunucuyu başlat"""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_ipn)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"IPN sunucusu başlatıldı: http://{self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        """Sunucuyu durdur"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info("IPN sunucusu durduruldu")
+
+    async def _handle_ipn(self, request: web.Request) -> web.Response:
+        """IPN isteğini doğrula ve durum değişikliğini ilet"""
+        try:
+            payload = json.loads(await request.read())
+        except ValueError:
+            logger.warning("Geçersiz IPN gövdesi")
+            return web.json_response({'error': 'invalid body'}, status=400)
+        
+        if not verify_ipn_signature(payload, request.headers.get('x-nowpayments-sig'), self.secret):
+            logger.warning(f"Geçersiz IPN imzası - Payment ID: {payload.get('payment_id')}")
+            return web.json_response({'error': 'invalid signature'}, status=401)
+        
+        payment_id = payload.get('payment_id')
+        status = payload.get('payment_status')
+        if payment_id is None or not status:
+            return web.json_response({'error': 'missing fields'}, status=400)
+        
+        logger.info(f"IPN alındı - Payment ID: {payment_id}, Durum: {status}")
+        try:
+            await self.on_status_change(str(payment_id), status, payload)
+        except Exception as e:
+            # 5xx yanıtı NowPayments'ın bildirimi tekrar göndermesini sağlar
+            logger.error(f"IPN işleme hatası: {str(e)}", exc_info=True)
+            return web.json_response({'error': 'processing failed'}, status=500)
+        
+        return web.json_response({'ok': True})
@@ -0,0 +1,65 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# Önbellekte olmayan kayıt; None "üyelik kaydı yok" anlamında önbelleğe alınır
+MISS = object()
+
+class MemberCache:
+    """Üyelik kayıtları için boyutu ve yaşı sınırlı LRU önbellek.
+
+    Yazmalar kaydı silmek yerine doğrudan günceller; süre sınırı başka süreçlerde
+    yapılan değişikliklerin en geç ttl saniye içinde görülmesini sağlar.
+    """
+
+    def __init__(self, max_size: int = None, ttl: float = None):
+        self.max_size = max_size or int(os.getenv('MEMBER_CACHE_SIZE', 10000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('MEMBER_CACHE_TTL', 300))
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # user_id -> (record, cached_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._entries
+
+    def get(self, user_id: int):
+        """Kaydı getir; yoksa veya eskiyse MISS döndür"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[0]) if entry[0] is not None else None
+
+    def put(self, user_id: int, record):
+        """Kaydı ekle veya değiştir"""
+        with self._lock:
+            self._entries[user_id] = (record, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def update(self, user_id: int, **fields):
+        """Önbellekteki kaydın alanlarını güncelle"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] is not None:
+                entry[0].update(fields)
+                self._entries[user_id] = (entry[0], time.monotonic())
+
+    def metrics(self) -> dict:
+        """İsabet sayıları ve oranı"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
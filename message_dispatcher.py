@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from telegram.error import RetryAfter
+from rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Öncelik şeritleri: küçük değer önce gönderilir
+PRIORITY_HIGH = 0  # Ödeme onayları ve davet bağlantıları
+PRIORITY_NORMAL = 1  # Etkileşimli yanıtlar ve admin bildirimleri
+PRIORITY_BULK = 2  # Toplu bildirimler
+
+LANE_NAMES = {
+    PRIORITY_HIGH: 'high',
+    PRIORITY_NORMAL: 'normal',
+    PRIORITY_BULK: 'bulk',
+}
+
+class _OutboundJob:
+    __slots__ = ('method', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, method: str, kwargs: dict, future: asyncio.Future):
+        self.method = method
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+class MessageDispatcher:
+    """Tüm giden Telegram mesajlarını tek kuyruktan, hız sınırlarına uyarak gönderir.
+
+    Genel hız sınırı bir token bucket ile, sohbet başına sınır ise sohbetin bir
+    sonraki gönderim zamanı tutularak uygulanır. Hazır olmayan sohbetin işi
+    işçiyi bekletmeden kuyruğa geri bırakılır. RetryAfter hatasında gönderim
+    durdurulur ve iş aynı öncelikle yeniden denenir.
+    """
+
+    def __init__(self, global_rate: float = None, workers: int = None):
+        self.global_limiter = RateLimiter(global_rate or float(os.getenv('DISPATCH_GLOBAL_RATE', 25)))
+        self.private_interval = float(os.getenv('DISPATCH_PRIVATE_CHAT_INTERVAL', 1))
+        self.group_interval = float(os.getenv('DISPATCH_GROUP_CHAT_INTERVAL', 3))
+        self.max_retries = int(os.getenv('DISPATCH_MAX_RETRIES', 5))
+        self.workers = workers or int(os.getenv('DISPATCH_WORKERS', 8))
+        self._queue = asyncio.PriorityQueue()
+        self._sequence = itertools.count()
+        self._chat_ready_at = {}  # chat_id -> bir sonraki gönderimin yapılabileceği zaman
+        self._depth = {lane: 0 for lane in LANE_NAMES}
+        self._stats = {'sent': 0, 'failed': 0, 'retried': 0}
+        self._bot = None
+        self._tasks = []
+
+    async def start(self, bot):
+        """İşçileri başlat"""
+        self._bot = bot
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"dispatcher-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Mesaj göndericisi başlatıldı - {self.workers} işçi")
+
+    async def stop(self):
+        """İşçileri durdur, bekleyen işleri iptal et"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            _, _, job = self._queue.get_nowait()
+            job.future.cancel()
+        logger.info("Mesaj göndericisi durduruldu")
+
+    def submit(self, method: str, priority: int = PRIORITY_NORMAL, **kwargs) -> asyncio.Future:
+        """Bot API çağrısını kuyruğa ekle; sonucu taşıyan Future döndür"""
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(priority, _OutboundJob(method, kwargs, future))
+        return future
+
+    async def send_message(self, chat_id, text: str, priority: int = PRIORITY_NORMAL, **kwargs):
+        """Mesajı kuyruğa ekle ve gönderilmesini bekle"""
+        return await self.submit('send_message', priority, chat_id=chat_id, text=text, **kwargs)
+
+    def metrics(self) -> dict:
+        """Şerit bazında kuyruk derinliği ve gönderim sayaçları"""
+        return {
+            'queue_depth': {LANE_NAMES[lane]: depth for lane, depth in self._depth.items()},
+            **self._stats,
+        }
+
+    def _enqueue(self, priority: int, job: _OutboundJob):
+        self._depth[priority] += 1
+        self._queue.put_nowait((priority, next(self._sequence), job))
+
+    def _chat_interval(self, chat_id) -> float:
+        # Grup ve kanal ID'leri negatiftir
+        try:
+            return self.group_interval if int(chat_id) < 0 else self.private_interval
+        except (TypeError, ValueError):
+            return self.group_interval
+
+    def _defer_until_ready(self, loop, priority: int, sequence: int, job, chat_id) -> bool:
+        """Sohbet henüz hazır değilse işi beklemeden sırasına geri koy"""
+        ready_at = self._chat_ready_at.get(chat_id, 0)
+        now = time.monotonic()
+        if ready_at <= now:
+            return False
+        loop.call_later(ready_at - now, self._queue.put_nowait, (priority, sequence, job))
+        return True
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, sequence, job = await self._queue.get()
+            if job.future.done():
+                self._depth[priority] -= 1
+                continue
+            
+            chat_id = job.kwargs.get('chat_id')
+            if self._defer_until_ready(loop, priority, sequence, job, chat_id):
+                continue
+            
+            await self.global_limiter.acquire()
+            # Genel kota beklenirken aynı sohbete başka bir iş gönderilmiş olabilir;
+            # sohbet hazırlığı gönderimden hemen önce yeniden denetlenip işaretlenir
+            if self._defer_until_ready(loop, priority, sequence, job, chat_id):
+                continue
+            now = time.monotonic()
+            self._chat_ready_at[chat_id] = now + self._chat_interval(chat_id)
+            if len(self._chat_ready_at) > 10000:
+                self._chat_ready_at = {
+                    chat: ready for chat, ready in self._chat_ready_at.items() if ready > now
+                }
+            try:
+                result = await getattr(self._bot, job.method)(**job.kwargs)
+            except RetryAfter as e:
+                job.attempts += 1
+                self.global_limiter.pause(e.retry_after)
+                self._chat_ready_at[chat_id] = time.monotonic() + e.retry_after
+                if job.attempts <= self.max_retries:
+                    logger.warning(f"Telegram hız sınırı - {e.retry_after} saniye bekleniyor, Chat ID: {chat_id}")
+                    self._stats['retried'] += 1
+                    self._queue.put_nowait((priority, sequence, job))
+                    continue
+                self._finish(priority, job, error=e)
+            except Exception as e:
+                self._finish(priority, job, error=e)
+            else:
+                self._finish(priority, job, result=result)
+
+    def _finish(self, priority: int, job: _OutboundJob, result=None, error: Exception = None):
+        self._depth[priority] -= 1
+        if job.future.done():
+            return
+        if error is not None:
+            self._stats['failed'] += 1
+            job.future.set_exception(error)
+        else:
+            self._stats['sent'] += 1
+            job.future.set_result(result)
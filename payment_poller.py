@@ -0,0 +1,81 @@
+import os
+import time
+import asyncio
+import logging
+from payment_processor import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+class PaymentPoller:
+    """Açık NowPayments ödemelerini yaşlarına göre seyrelen aralıklarla sorgular"""
+
+    def __init__(self, processor, on_status, concurrency: int = None):
+        self.processor = processor
+        self.on_status = on_status  # async (bot, payment_id, status)
+        self.concurrency = concurrency or int(os.getenv('POLLER_CONCURRENCY', 5))
+        self.expiry_seconds = int(os.getenv('PAYMENT_EXPIRY_MINUTES', 20)) * 60
+        self.max_age_seconds = int(os.getenv('POLLER_MAX_AGE_MINUTES', 120)) * 60
+        self._payments = {}  # payment_id -> [created_at, next_poll_at]
+        self._in_flight = set()
+
+    def __len__(self):
+        return len(self._payments)
+
+    def track(self, payment_id: str, created_at: float = None):
+        """Ödemeyi takip listesine ekle"""
+        created_at = created_at or time.time()
+        self._payments[payment_id] = [created_at, created_at + self._interval(0)]
+
+    def untrack(self, payment_id: str):
+        """Ödemeyi takip listesinden çıkar"""
+        self._payments.pop(payment_id, None)
+
+    def _interval(self, age: float) -> float:
+        """Ödemenin yaşına göre bir sonraki sorguya kadar beklenecek süre"""
+        if age < 120:
+            return 15
+        if age < self.expiry_seconds / 2:
+            return 30
+        if age < self.expiry_seconds:
+            return 60
+        # Süresi dolmuş ama blokzincir onayı gecikebilecek ödemeler
+        return 300
+
+    async def poll_due(self, context) -> None:
+        """Zamanı gelen ödemeleri sınırlı eşzamanlılıkla sorgula (job queue callback'i)"""
+        now = time.time()
+        due = []
+        for payment_id, (created_at, next_poll_at) in list(self._payments.items()):
+            if payment_id in self._in_flight or next_poll_at > now:
+                continue
+            age = now - created_at
+            if age > self.max_age_seconds:
+                logger.info(f"Ödeme takibi zaman aşımına uğradı: {payment_id}")
+                self.untrack(payment_id)
+                continue
+            self._payments[payment_id][1] = now + self._interval(age)
+            due.append(payment_id)
+        
+        if not due:
+            return
+        
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def poll(payment_id: str):
+            async with semaphore:
+                self._in_flight.add(payment_id)
+                try:
+                    result = await self.processor.check_payment(payment_id)
+                    if not result.get('success'):
+                        return
+                    status = result.get('status')
+                    if status in TERMINAL_STATUSES:
+                        self.untrack(payment_id)
+                    await self.on_status(context.bot, payment_id, status)
+                except Exception as e:
+                    logger.error(f"Ödeme sorgulama hatası - Payment ID: {payment_id}, Hata: {str(e)}")
+                finally:
+                    self._in_flight.discard(payment_id)
+        
+        logger.info(f"{len(due)} ödeme sorgulanıyor, takipteki toplam: {len(self._payments)}")
+        await asyncio.gather(*(poll(payment_id) for payment_id in due))
@@ -1,9 +1,13 @@
 import os
 import logging
+import asyncio
+import time
 import aiohttp
 from datetime import datetime, timedelta
 import secrets
 import json
+from collections import OrderedDict
+from pending_payments import PendingPayment, PendingPaymentStore, MICROS, amount_key
 
 # Loglama ayarları
 logging.basicConfig(
@@ -12,12 +16,43 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Ödemenin alındığını gösteren NowPayments durumları
+PAID_STATUSES = ('confirmed', 'finished', 'partially_paid')
+# Artık değişmeyecek NowPayments durumları
+TERMINAL_STATUSES = ('finished', 'failed', 'refunded', 'expired')
+# Henüz ödeme görmemiş, kullanıcıya tekrar gösterilebilecek fatura durumları
+OPEN_STATUSES = ('pending', 'waiting')
+
 class ManualUSDTProcessor:
-    def __init__(self):
+    def __init__(self, db=None):
         self.minimum_payment = float(os.getenv('MINIMUM_PAYMENT_USD', 30))
         self.subscription_days = int(os.getenv('SUBSCRIPTION_DAYS', 30))
         self.wallet_address = os.getenv('USDT_WALLET_ADDRESS', 'YOUR_WALLET_ADDRESS')
-        self.pending_payments = {}  # payment_id -> payment_info
+        self.payment_ttl = 20 * 60
+        self.pending_payments = PendingPaymentStore(db=db, pay_address=self.wallet_address)  # payment_id -> PendingPayment
+        # Her ödemeye tutarın sonuna mikro birim (1e-6 USDT) cinsinden benzersiz fark eklenir;
+        # fark alanı bekleyen ve bekleme süresindeki tüm ödemeleri karşılayacak genişliktedir
+        self.offset_step = int(os.getenv('USDT_AMOUNT_OFFSET_STEP_MICROS', 1))
+        self.offset_slots = (int(os.getenv('USDT_AMOUNT_OFFSET_SLOTS', 0))
+                             or 10 * self.pending_payments.max_size)
+        self._next_offset = 1
+
+    async def start(self):
+        """Yeniden başlatmada açık ödemeleri ve ayrılmış tutarları veritabanından yükle"""
+        since = time.time() - self.payment_ttl - self.pending_payments.reuse_grace
+        await self.pending_payments.load(since)
+
+    def _allocate_amount(self):
+        """Ayrılmamış bir tutar bul; farklar sırayla döndürülür, en küçüğü hemen tekrar verilmez"""
+        self.pending_payments.purge_expired()
+        base = amount_key(self.minimum_payment)
+        for i in range(self.offset_slots):
+            offset = (self._next_offset - 1 + i) % self.offset_slots + 1
+            amount = (base + offset * self.offset_step) / MICROS
+            if not self.pending_payments.has_amount(amount):
+                self._next_offset = offset % self.offset_slots + 1
+                return amount
+        return None
 
     async def create_payment(self, user_id: int, username: str) -> dict:
         """Yeni bir ödeme oluştur"""
@@ -25,25 +60,31 @@ class ManualUSDTProcessor:
             # Benzersiz bir ödeme ID'si oluştur
             payment_id = secrets.token_hex(12)
             
+            # Gelen transferin bu ödemeye eşlenebilmesi için benzersiz tutar ayır
+            amount = self._allocate_amount()
+            if amount is None:
+                logger.warning("Boşta benzersiz USDT tutarı kalmadı")
+                return None
+            
             # Ödeme bilgilerini kaydet
-            payment_info = {
-                'user_id': user_id,
-                'username': username,
-                'amount': self.minimum_payment,
-                'payment_id': payment_id,
-                'status': 'pending',
-                'created_at': datetime.now(),
-                'expires_at': datetime.now() + timedelta(minutes=20)
-            }
+            now = time.time()
+            payment = PendingPayment(
+                payment_id=payment_id,
+                user_id=user_id,
+                username=username,
+                amount=amount,
+                created_at=now,
+                expires_at=now + self.payment_ttl
+            )
             
-            self.pending_payments[payment_id] = payment_info
+            self.pending_payments.add(payment)
             
             return {
                 'payment_id': payment_id,
                 'wallet_address': self.wallet_address,
-                'amount': self.minimum_payment,
+                'amount': amount,
                 'currency': 'USDT (TRC-20)',
-                'expires_at': payment_info['expires_at']
+                'expires_at': datetime.fromtimestamp(payment.expires_at)
             }
             
         except Exception as e:
@@ -52,58 +93,211 @@ class ManualUSDTProcessor:
 
     def check_payment_status(self, payment_id: str) -> dict:
         """Ödeme durumunu kontrol et"""
-        if payment_id in self.pending_payments:
-            payment = self.pending_payments[payment_id]
-            if datetime.now() > payment['expires_at']:
-                payment['status'] = 'expired'
+        payment = self.pending_payments.get(payment_id)
+        if payment is not None:
+            if time.time() > payment.expires_at:
+                self.pending_payments.set_status(payment_id, 'expired')
             return {
-                'status': payment['status'],
-                'expires_at': payment['expires_at']
+                'status': payment.status,
+                'expires_at': datetime.fromtimestamp(payment.expires_at)
             }
         return {'status': 'not_found'}
 
+    def match_deposit(self, amount: float, txid: str):
+        """Gelen transferi tutarından bekleyen ödemeye eşle ve ödemeyi onayla"""
+        now = time.time()
+        payment = self.pending_payments.find_by_amount(amount)
+        if payment is None:
+            # Tutar benzersiz olduğundan bekleme süresindeki geç transfer de sahibine aittir
+            payment = self.pending_payments.find_expired_by_amount(amount, now)
+            if payment is None:
+                return None
+        if payment.status not in ('pending', 'expired'):
+            return None
+        if now > payment.expires_at + self.pending_payments.reuse_grace:
+            return None
+        
+        self.pending_payments.settle(payment, 'confirmed')
+        if now > payment.expires_at:
+            logger.warning(
+                f"Süresi dolmuş ödemeye geç USDT transferi kabul edildi - "
+                f"Payment ID: {payment.payment_id}, TX: {txid}"
+            )
+        else:
+            logger.info(f"USDT transferi eşlendi - Payment ID: {payment.payment_id}, TX: {txid}")
+        return payment
+
 class NowPaymentsProcessor:
     def __init__(self):
         self.api_key = os.getenv('NOWPAYMENTS_API_KEY')
         self.api_url = os.getenv('NOWPAYMENTS_API_URL', 'https://api.nowpayments.io/v1')
+        self.ipn_callback_url = os.getenv('NOWPAYMENTS_IPN_CALLBACK_URL')
+        self.payment_expiry_minutes = int(os.getenv('PAYMENT_EXPIRY_MINUTES', 20))
         self.headers = {
             'x-api-key': self.api_key,
             'Content-Type': 'application/json'
         }
+        # Bağlantı havuzu ve zaman aşımı ayarları
+        self.pool_size = int(os.getenv('NOWPAYMENTS_POOL_SIZE', 20))
+        self.keepalive_timeout = float(os.getenv('NOWPAYMENTS_KEEPALIVE_TIMEOUT', 30))
+        self.dns_cache_ttl = int(os.getenv('NOWPAYMENTS_DNS_CACHE_TTL', 300))
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv('NOWPAYMENTS_TIMEOUT', 15)),
+            connect=float(os.getenv('NOWPAYMENTS_CONNECT_TIMEOUT', 5))
+        )
+        self._session = None
+        # Fiyat tahmini önbelleği ayarları
+        self.estimate_ttl = float(os.getenv('NOWPAYMENTS_ESTIMATE_TTL', 60))
+        self.estimate_max_stale = float(os.getenv('NOWPAYMENTS_ESTIMATE_MAX_STALE', 600))
+        self.estimate_hot_window = float(os.getenv('NOWPAYMENTS_ESTIMATE_HOT_WINDOW', 1800))
+        self._estimates = {}  # (amount, currency_from, currency_to) -> [estimated_amount, fetched_at, last_used]
+        self._estimate_tasks = {}  # (amount, currency_from, currency_to) -> asyncio.Task
+        self._estimate_refresher = None
+        # Ödeme durumu önbelleği: kesinleşmemiş durumlar kısa süre, kesinleşenler kalıcı tutulur
+        self.status_ttl = float(os.getenv('NOWPAYMENTS_STATUS_TTL', 5))
+        self.status_cache_size = int(os.getenv('NOWPAYMENTS_STATUS_CACHE_SIZE', 10000))
+        self._statuses = OrderedDict()  # payment_id -> (result, fetched_at)
+        self._status_tasks = {}  # payment_id -> asyncio.Task
+        # Ödeme listesi uç noktası hesap bilgileriyle alınan kısa ömürlü JWT ister
+        self.email = os.getenv('NOWPAYMENTS_EMAIL')
+        self.password = os.getenv('NOWPAYMENTS_PASSWORD')
+        self._jwt = None
+        self._jwt_expires_at = 0
         logger.info(f"NowPayments API URL: {self.api_url}")
 
+    async def start(self):
+        """Paylaşılan HTTP oturumunu aç"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size,
+            limit_per_host=self.pool_size,
+            ttl_dns_cache=self.dns_cache_ttl,
+            keepalive_timeout=self.keepalive_timeout
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=self.timeout
+        )
+        logger.info(f"NowPayments HTTP oturumu açıldı - Havuz: {self.pool_size}")
+        if self._estimate_refresher is None or self._estimate_refresher.done():
+            self._estimate_refresher = asyncio.create_task(self._refresh_estimates())
+
+    async def close(self):
+        """Paylaşılan HTTP oturumunu kapat"""
+        tasks = list(self._estimate_tasks.values()) + list(self._status_tasks.values())
+        if self._estimate_refresher is not None:
+            tasks.append(self._estimate_refresher)
+            self._estimate_refresher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._estimate_tasks.clear()
+        self._status_tasks.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("NowPayments HTTP oturumu kapatıldı")
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Açık oturumu döndür, gerekirse aç"""
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def get_estimate(self, amount: float, currency_from: str = 'usd',
+                           currency_to: str = 'btc'):
+        """Fiyat tahminini önbellekten getir, eskiyse arka planda yenile"""
+        key = (str(amount), currency_from, currency_to)
+        now = time.monotonic()
+        entry = self._estimates.get(key)
+        
+        if entry is not None:
+            entry[2] = now
+            age = now - entry[1]
+            if age < self.estimate_ttl:
+                return entry[0]
+            if age < self.estimate_max_stale:
+                # Eski değeri hemen döndür, yenilemeyi arka planda yap
+                self._schedule_estimate_refresh(key)
+                return entry[0]
+        
+        # Önbellekte kullanılabilir değer yok, yenilemeyi bekle
+        return await asyncio.shield(self._schedule_estimate_refresh(key))
+
+    def _schedule_estimate_refresh(self, key: tuple) -> asyncio.Task:
+        """Aynı anahtar için tek bir yenileme görevi çalıştır"""
+        task = self._estimate_tasks.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch_estimate(key))
+            self._estimate_tasks[key] = task
+            task.add_done_callback(lambda _: self._estimate_tasks.pop(key, None))
+        return task
+
+    async def _fetch_estimate(self, key: tuple):
+        """Fiyat tahminini API'den al ve önbelleğe yaz"""
+        amount, currency_from, currency_to = key
+        try:
+            session = await self._get_session()
+            estimate_url = f"{self.api_url}/estimate"
+            logger.info(f"Fiyat tahmini alınıyor: {estimate_url}")
+            
+            async with session.get(
+                estimate_url,
+                timeout=self.timeout,
+                params={
+                    "amount": amount,
+                    "currency_from": currency_from,
+                    "currency_to": currency_to
+                }
+            ) as response:
+                estimate_response = await response.text()
+                logger.info(f"Fiyat tahmini yanıtı: {estimate_response}")
+                
+                if response.status != 200:
+                    logger.error(f"Fiyat tahmini hatası: {estimate_response}")
+                    return None
+                
+                estimated_amount = json.loads(estimate_response).get('estimated_amount')
+        except Exception as e:
+            logger.error(f"Fiyat tahmini hatası: {str(e)}")
+            return None
+        
+        now = time.monotonic()
+        entry = self._estimates.get(key)
+        last_used = entry[2] if entry is not None else now
+        self._estimates[key] = [estimated_amount, now, last_used]
+        return estimated_amount
+
+    async def _refresh_estimates(self):
+        """Sık kullanılan fiyat tahminlerini süreleri dolmadan yenile"""
+        interval = max(self.estimate_ttl / 2, 1)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, (_, fetched_at, last_used) in list(self._estimates.items()):
+                if now - last_used > self.estimate_hot_window:
+                    # Uzun süredir kullanılmayan çifti önbellekten çıkar
+                    del self._estimates[key]
+                elif now - fetched_at >= interval:
+                    self._schedule_estimate_refresh(key)
+
     async def create_payment(self, amount_usd: float) -> dict:
         """Yeni bir ödeme oluştur"""
         try:
             logger.info(f"Ödeme oluşturma başlatıldı - Miktar: {amount_usd} USD")
             
-            # Önce fiyat tahmini al
-            async with aiohttp.ClientSession() as session:
-                estimate_url = f"{self.api_url}/estimate"
-                logger.info(f"Fiyat tahmini alınıyor: {estimate_url}")
-                
-                async with session.get(
-                    estimate_url,
-                    headers=self.headers,
-                    params={
-                        "amount": str(amount_usd),
-                        "currency_from": "usd",
-                        "currency_to": "btc"
-                    }
-                ) as response:
-                    estimate_response = await response.text()
-                    logger.info(f"Fiyat tahmini yanıtı: {estimate_response}")
-                    
-                    if response.status == 200:
-                        estimate_data = json.loads(estimate_response)
-                        estimated_amount = estimate_data.get('estimated_amount')
-                        logger.info(f"Tahmini BTC miktarı: {estimated_amount}")
-                    else:
-                        logger.error(f"Fiyat tahmini hatası: {estimate_response}")
-                        return {
-                            'success': False,
-                            'error': 'Fiyat tahmini alınamadı'
-                        }
+            # Önce fiyat tahmini al (önbellekten)
+            estimated_amount = await self.get_estimate(amount_usd, 'usd', 'btc')
+            if estimated_amount is None:
+                return {
+                    'success': False,
+                    'error': 'Fiyat tahmini alınamadı'
+                }
+            logger.info(f"Tahmini BTC miktarı: {estimated_amount}")
+
+            session = await self._get_session()
 
             # Ödeme oluştur
             payment_id = secrets.token_hex(8)
@@ -115,40 +309,42 @@ class NowPaymentsProcessor:
                 "order_description": "Telegram Grup Erişimi",
                 "case": "success"
             }
+            if self.ipn_callback_url:
+                payment_data["ipn_callback_url"] = self.ipn_callback_url
             logger.info(f"Ödeme isteği gönderiliyor: {json.dumps(payment_data)}")
             
-            async with aiohttp.ClientSession() as session:
-                payment_url = f"{self.api_url}/payment"
-                logger.info(f"Ödeme URL: {payment_url}")
+            payment_url = f"{self.api_url}/payment"
+            logger.info(f"Ödeme URL: {payment_url}")
+            
+            async with session.post(
+                payment_url,
+                timeout=self.timeout,
+                json=payment_data
+            ) as response:
+                payment_response = await response.text()
+                logger.info(f"Ödeme yanıtı: {payment_response}")
                 
-                async with session.post(
-                    payment_url,
-                    headers=self.headers,
-                    json=payment_data
-                ) as response:
-                    payment_response = await response.text()
-                    logger.info(f"Ödeme yanıtı: {payment_response}")
-                    
-                    if response.status == 201:
-                        data = json.loads(payment_response)
-                        expires_at = datetime.now() + timedelta(minutes=20)
-                        result = {
-                            'success': True,
-                            'payment_id': data.get('payment_id'),
-                            'wallet_address': data.get('pay_address'),
-                            'amount_btc': data.get('pay_amount'),
-                            'amount_usd': amount_usd,
-                            'expires_at': expires_at.strftime('%Y-%m-%d %H:%M:%S')
-                        }
-                        logger.info(f"Ödeme başarıyla oluşturuldu: {json.dumps(result)}")
-                        return result
-                    else:
-                        logger.error(f"Ödeme oluşturma hatası: {payment_response}")
-                        error_msg = json.loads(payment_response).get('message', 'Ödeme oluşturulamadı')
-                        return {
-                            'success': False,
-                            'error': error_msg
-                        }
+                if response.status == 201:
+                    data = json.loads(payment_response)
+                    expires_at = datetime.now() + timedelta(minutes=self.payment_expiry_minutes)
+                    result = {
+                        'success': True,
+                        'payment_id': data.get('payment_id'),
+                        'wallet_address': data.get('pay_address'),
+                        'amount_btc': data.get('pay_amount'),
+                        'amount_usd': amount_usd,
+                        'expires_at': expires_at.strftime('%Y-%m-%d %H:%M:%S'),
+                        'expires_at_ts': int(expires_at.timestamp())
+                    }
+                    logger.info(f"Ödeme başarıyla oluşturuldu: {json.dumps(result)}")
+                    return result
+                else:
+                    logger.error(f"Ödeme oluşturma hatası: {payment_response}")
+                    error_msg = json.loads(payment_response).get('message', 'Ödeme oluşturulamadı')
+                    return {
+                        'success': False,
+                        'error': error_msg
+                    }
         except Exception as e:
             logger.error(f"Ödeme oluşturma hatası: {str(e)}", exc_info=True)
             return {
@@ -157,45 +353,144 @@ class NowPaymentsProcessor:
             }
 
     async def check_payment(self, payment_id: str) -> dict:
-        """Ödeme durumunu kontrol et"""
+        """Ödeme durumunu önbellekten getir, yoksa aynı ödeme için tek bir sorgu yap"""
+        payment_id = str(payment_id)
+        entry = self._statuses.get(payment_id)
+        if entry is not None:
+            result, fetched_at = entry
+            if (result['status'] in TERMINAL_STATUSES
+                    or time.monotonic() - fetched_at < self.status_ttl):
+                self._statuses.move_to_end(payment_id)
+                return dict(result)
+        
+        # Eşzamanlı kontroller aynı istek sonucunu paylaşır
+        task = self._status_tasks.get(payment_id)
+        if task is None or task.done():
+            task = asyncio.create_task(self._fetch_payment_status(payment_id))
+            self._status_tasks[payment_id] = task
+            task.add_done_callback(lambda _: self._status_tasks.pop(payment_id, None))
+        return dict(await asyncio.shield(task))
+
+    def invalidate_status(self, payment_id: str):
+        """Önbellekteki ödeme durumunu sil (ör. IPN bildirimi sonrası)"""
+        self._statuses.pop(str(payment_id), None)
+
+    def _cache_status(self, payment_id: str, result: dict):
+        self._statuses[payment_id] = (result, time.monotonic())
+        self._statuses.move_to_end(payment_id)
+        while len(self._statuses) > self.status_cache_size:
+            self._statuses.popitem(last=False)
+
+    async def _fetch_payment_status(self, payment_id: str) -> dict:
+        """Ödeme durumunu API'den al, başarılı yanıtı önbelleğe yaz"""
         try:
             logger.info(f"Ödeme kontrolü başlatıldı - Payment ID: {payment_id}")
             
-            async with aiohttp.ClientSession() as session:
-                payment_url = f"{self.api_url}/payment/{payment_id}"
-                logger.info(f"Ödeme kontrol URL: {payment_url}")
+            session = await self._get_session()
+            payment_url = f"{self.api_url}/payment/{payment_id}"
+            logger.info(f"Ödeme kontrol URL: {payment_url}")
+            
+            async with session.get(
+                payment_url,
+                timeout=self.timeout
+            ) as response:
+                payment_response = await response.text()
+                logger.info(f"Ödeme kontrol yanıtı: {payment_response}")
                 
-                async with session.get(
-                    payment_url,
-                    headers=self.headers
-                ) as response:
-                    payment_response = await response.text()
-                    logger.info(f"Ödeme kontrol yanıtı: {payment_response}")
-                    
-                    if response.status == 200:
-                        data = json.loads(payment_response)
-                        result = {
-                            'success': True,
-                            'status': data.get('payment_status'),
-                            'paid': data.get('payment_status') in ['confirmed', 'finished', 'partially_paid'],
-                            'amount_btc': data.get('pay_amount'),
-                            'amount_usd': data.get('price_amount'),
-                            'actual_amount': data.get('actually_paid'),
-                            'created_at': data.get('created_at'),
-                            'updated_at': data.get('updated_at')
-                        }
-                        logger.info(f"Ödeme durumu alındı: {json.dumps(result)}")
-                        return result
-                    else:
-                        logger.error(f"Ödeme kontrol hatası: {payment_response}")
-                        error_msg = json.loads(payment_response).get('message', 'Ödeme bulunamadı')
-                        return {
-                            'success': False,
-                            'error': error_msg
-                        }
+                if response.status == 200:
+                    data = json.loads(payment_response)
+                    result = {
+                        'success': True,
+                        'status': data.get('payment_status'),
+                        'paid': data.get('payment_status') in PAID_STATUSES,
+                        'amount_btc': data.get('pay_amount'),
+                        'amount_usd': data.get('price_amount'),
+                        'actual_amount': data.get('actually_paid'),
+                        'created_at': data.get('created_at'),
+                        'updated_at': data.get('updated_at')
+                    }
+                    logger.info(f"Ödeme durumu alındı: {json.dumps(result)}")
+                    self._cache_status(payment_id, result)
+                    return result
+                else:
+                    logger.error(f"Ödeme kontrol hatası: {payment_response}")
+                    error_msg = json.loads(payment_response).get('message', 'Ödeme bulunamadı')
+                    return {
+                        'success': False,
+                        'error': error_msg
+                    }
         except Exception as e:
             logger.error(f"Ödeme kontrol hatası: {str(e)}", exc_info=True)
             return {
                 'success': False,
                 'error': 'Bir hata oluştu'
             }
+
+    async def _get_jwt(self):
+        """Ödeme listesi için JWT al (NowPayments token'ı 5 dakika geçerlidir)"""
+        if self._jwt and time.monotonic() < self._jwt_expires_at:
+            return self._jwt
+        
+        session = await self._get_session()
+        async with session.post(
+            f"{self.api_url}/auth",
+            timeout=self.timeout,
+            json={"email": self.email, "password": self.password}
+        ) as response:
+            auth_response = await response.text()
+            if response.status != 200:
+                logger.error(f"NowPayments kimlik doğrulama hatası: {auth_response}")
+                return None
+            self._jwt = json.loads(auth_response).get('token')
+            self._jwt_expires_at = time.monotonic() + 240
+            return self._jwt
+
+    async def list_payments(self, page: int = 0, limit: int = 100, date_from: str = None) -> dict:
+        """Ödemeleri son güncellenenden başlayarak sayfalı listele"""
+        try:
+            token = await self._get_jwt()
+            if not token:
+                return {
+                    'success': False,
+                    'error': 'Kimlik doğrulanamadı'
+                }
+            
+            params = {
+                "limit": limit,
+                "page": page,
+                "sortBy": "updated_at",
+                "orderBy": "desc"
+            }
+            if date_from:
+                params["dateFrom"] = date_from
+            
+            session = await self._get_session()
+            async with session.get(
+                f"{self.api_url}/payment/",
+                timeout=self.timeout,
+                params=params,
+                headers={"Authorization": f"Bearer {token}"}
+            ) as response:
+                list_response = await response.text()
+                
+                if response.status == 200:
+                    data = json.loads(list_response)
+                    return {
+                        'success': True,
+                        'payments': data.get('data', []),
+                        'pages': data.get('pagesCount', 0)
+                    }
+                else:
+                    logger.error(f"Ödeme listesi hatası: {list_response}")
+                    if response.status == 401:
+                        self._jwt = None
+                    return {
+                        'success': False,
+                        'error': json.loads(list_response).get('message', 'Ödeme listesi alınamadı')
+                    }
+        except Exception as e:
+            logger.error(f"Ödeme listesi hatası: {str(e)}", exc_info=True)
+            return {
+                'success': False,
+                'error': 'Bir hata oluştu'
+            }
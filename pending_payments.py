@@ -0,0 +1,219 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# TRC-20 USDT 6 ondalık basamaklıdır; tutarlar bu birimde tam sayı olarak karşılaştırılır
+MICROS = 1_000_000
+
+def amount_key(amount: float) -> int:
+    """Tutarı mikro birim (1e-6 USDT) cinsinden tam sayı anahtara çevir"""
+    return int(round(float(amount) * MICROS))
+
+class PendingPayment:
+    """Bekleyen ödeme kaydı (zamanlar epoch saniye)"""
+    __slots__ = ('payment_id', 'user_id', 'username', 'amount', 'status', 'created_at', 'expires_at')
+
+    def __init__(self, payment_id: str, user_id: int, username: str, amount: float,
+                 created_at: float, expires_at: float, status: str = 'pending'):
+        self.payment_id = payment_id
+        self.user_id = user_id
+        self.username = username
+        self.amount = amount
+        self.status = status
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+class PendingPaymentStore:
+    """Boyutu sınırlı, süresi dolan kayıtları bitiş sırasıyla atan bekleyen ödeme deposu.
+
+    Kayıtlar bir sözlükte, bitiş zamanları bir min-heap'te tutulur; süresi dolan
+    veya kapasite aşımında en erken bitecek kayıt O(log n) ile atılır. Tutar
+    indeksi gelen transferin O(1) ile ödemesine eşlenmesini sağlar. Süresi dolan
+    ödemenin tutarı, geç gelen transfer başka bir ödemeye eşlenmesin diye bir
+    süre daha ayrılmış kalır. İsteğe bağlı olarak verilen AsyncDatabase'e
+    yazmalar sıraya alınır ve arka planda sırayla payments tablosuna aktarılır;
+    böylece disk işlemi event loop'u bloklamaz.
+    """
+
+    def __init__(self, max_size: int = None, db=None, reuse_grace: float = None,
+                 pay_address: str = None):
+        self.max_size = max_size or int(os.getenv('PENDING_PAYMENTS_MAX_SIZE', 10000))
+        self.db = db
+        self.pay_address = pay_address  # Kayıtlar yeniden yüklenirken bu adrese ait ödemeler seçilir
+        if reuse_grace is None:
+            reuse_grace = int(os.getenv('USDT_AMOUNT_REUSE_GRACE_MINUTES', 60)) * 60
+        self.reuse_grace = reuse_grace
+        self._entries = {}  # payment_id -> PendingPayment
+        self._heap = []  # (expires_at, payment_id)
+        self._by_amount = {}  # amount_key -> payment_id
+        self._reserved = {}  # amount_key -> (reserved_until, PendingPayment), süresi dolan ödemelerin tutarları
+        self._reserved_order = deque()  # (reserved_until, amount_key), ayrılma sırasına göre
+        self._writes = deque()  # (metot adı, argümanlar), veritabanına aktarılacak sırayla
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, payment_id: str):
+        return payment_id in self._entries
+
+    def get(self, payment_id: str):
+        """Kaydı getir, yoksa None"""
+        return self._entries.get(payment_id)
+
+    def find_by_amount(self, amount: float):
+        """Tutara ayrılmış kaydı getir, yoksa None"""
+        payment_id = self._by_amount.get(amount_key(amount))
+        return self._entries.get(payment_id) if payment_id else None
+
+    def has_amount(self, amount: float) -> bool:
+        """Tutar bekleyen veya yakın zamanda süresi dolan bir ödemeye ayrılmış mı"""
+        key = amount_key(amount)
+        return key in self._by_amount or key in self._reserved
+
+    def find_expired_by_amount(self, amount: float, now: float = None):
+        """Tutarı hâlâ ayrılmış olan süresi dolmuş ödemeyi getir, yoksa None"""
+        reserved = self._reserved.get(amount_key(amount))
+        if reserved is None or reserved[0] <= (now or time.time()):
+            return None
+        return reserved[1]
+
+    def settle(self, entry: PendingPayment, status: str):
+        """Ödemeyi kesinleştir: durumu yaz, depodan ve tutar ayrımından çıkar"""
+        self._persist_status(entry, status)
+        self.remove(entry.payment_id)
+        key = amount_key(entry.amount)
+        reserved = self._reserved.get(key)
+        if reserved is not None and reserved[1] is entry:
+            del self._reserved[key]
+
+    def add(self, entry: PendingPayment):
+        """Kaydı ekle; süresi dolanları ve kapasiteyi aşanları at"""
+        self._insert(entry)
+        self._queue_write(
+            'add_payment', entry.payment_id, entry.user_id, entry.amount, entry.status,
+            self.pay_address, str(entry.amount), int(entry.expires_at)
+        )
+
+    async def load(self, since: float) -> int:
+        """Yeniden başlatmada since sonrasında oluşturulmuş açık ödemeleri ve tutar indeksini geri yükle"""
+        if self.db is None:
+            return 0
+        rows = await self.db.get_open_payments_by_address(self.pay_address, int(since))
+        for payment_id, user_id, amount, status, created_at, expires_at in rows:
+            if payment_id in self._entries:
+                continue
+            self._insert(PendingPayment(
+                payment_id=payment_id,
+                user_id=user_id,
+                username=None,
+                amount=amount,
+                created_at=created_at,
+                expires_at=expires_at,
+                status=status
+            ))
+        # Süresi dolanlar bekleme süresi boyunca tutarlarını ayrılmış tutar
+        self.purge_expired()
+        logger.info(f"{len(rows)} açık USDT ödemesi yeniden yüklendi")
+        return len(rows)
+
+    def _insert(self, entry: PendingPayment):
+        self.purge_expired()
+        while len(self._entries) >= self.max_size:
+            evicted = self._pop_earliest()
+            if evicted is None:
+                break
+            logger.warning(f"Bekleyen ödeme kapasitesi doldu, kayıt atıldı: {evicted.payment_id}")
+        
+        self._entries[entry.payment_id] = entry
+        self._by_amount[amount_key(entry.amount)] = entry.payment_id
+        heapq.heappush(self._heap, (entry.expires_at, entry.payment_id))
+
+    def remove(self, payment_id: str):
+        """Kaydı depodan çıkar (heap'teki karşılığı sonradan ayıklanır)"""
+        entry = self._entries.pop(payment_id, None)
+        if entry is not None:
+            self._unindex(entry)
+        return entry
+
+    def set_status(self, payment_id: str, status: str):
+        """Kaydın durumunu güncelle"""
+        entry = self._entries.get(payment_id)
+        if entry is not None and entry.status != status:
+            self._persist_status(entry, status)
+
+    def purge_expired(self, now: float = None) -> int:
+        """Süresi dolmuş kayıtları at, atılan sayısını döndür"""
+        now = now or time.time()
+        purged = 0
+        while self._heap and self._heap[0][0] <= now:
+            entry = self._pop_earliest()
+            if entry is not None:
+                if entry.status == 'pending':
+                    self._persist_status(entry, 'expired')
+                purged += 1
+        # Bekleme süresi geçen tutarlar yeniden verilebilir
+        while self._reserved_order and self._reserved_order[0][0] <= now:
+            reserved_until, key = self._reserved_order.popleft()
+            reserved = self._reserved.get(key)
+            if reserved is not None and reserved[0] == reserved_until:
+                del self._reserved[key]
+        return purged
+
+    def _persist_status(self, entry: PendingPayment, status: str):
+        entry.status = status
+        self._queue_write('update_payment_status', entry.payment_id, status)
+
+    async def flush(self):
+        """Bekleyen yazmaları sırayla veritabanına aktar"""
+        async with self._flush_lock:
+            while self._writes:
+                method, args = self._writes.popleft()
+                try:
+                    await getattr(self.db, method)(*args)
+                except Exception as e:
+                    logger.error(f"Bekleyen ödeme kaydedilemedi - {method}{args}: {str(e)}")
+
+    def _queue_write(self, method: str, *args):
+        """Yazmayı sıraya al ve arka planda aktarımı başlat"""
+        if self.db is None:
+            return
+        self._writes.append((method, args))
+        if self._flush_task is None or self._flush_task.done():
+            try:
+                self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+            except RuntimeError:
+                # Event loop dışında çağrıldı; yazma sonraki aktarımda gönderilir
+                pass
+
+    def _pop_earliest(self):
+        """En erken bitecek geçerli kaydı heap'ten ve depodan çıkar"""
+        while self._heap:
+            expires_at, payment_id = heapq.heappop(self._heap)
+            entry = self._entries.get(payment_id)
+            # Silinmiş kayıtların heap'te kalan karşılıkları atlanır
+            if entry is not None and entry.expires_at == expires_at:
+                del self._entries[payment_id]
+                self._unindex(entry)
+                if entry.status in ('pending', 'expired'):
+                    self._reserve(entry)
+                return entry
+        return None
+
+    def _reserve(self, entry: PendingPayment):
+        """Süresi dolan ödemenin tutarını bekleme süresi boyunca ayrılmış tut"""
+        key = amount_key(entry.amount)
+        reserved_until = max(entry.expires_at, time.time()) + self.reuse_grace
+        self._reserved[key] = (reserved_until, entry)
+        self._reserved_order.append((reserved_until, key))
+
+    def _unindex(self, entry: PendingPayment):
+        key = amount_key(entry.amount)
+        if self._by_amount.get(key) == entry.payment_id:
+            del self._by_amount[key]
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = 'user_data'
+CHAT_DATA = 'chat_data'
+
+class SQLitePersistence(BasePersistence):
+    """user_data, chat_data ve konuşma durumlarını bot_state tablosunda saklayan kalıcılık katmanı.
+
+    Yazmalar önce bellekte biriktirilir ve kısa bir gecikmeyle tek işlemde
+    veritabanına aktarılır. Her kayıt bir sürüm taşır; bir işleyici çalışmadan önce
+    kayıt başka bir süreç tarafından değiştirildiyse yeniden okunur. Böylece aynı
+    veritabanını kullanan birden fazla bot süreci kullanıcı durumunu paylaşabilir.
+    Değerler JSON ile serileştirilebilir olmalıdır.
+    """
+
+    def __init__(self, db, flush_delay: float = None, update_interval: float = None):
+        super().__init__(
+            # bot_data paylaşılmayan süreç içi nesneler (ör. IPN sunucusu) tutar
+            store_data=PersistenceInput(bot_data=False, callback_data=False),
+            update_interval=update_interval or float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', 5))
+        )
+        self.db = db
+        self.flush_delay = flush_delay or float(os.getenv('PERSISTENCE_FLUSH_DELAY', 0.5))
+        self._versions = {}  # (kind, key) -> version
+        self._dirty = {}  # (kind, key) -> JSON metni, silinecekse None
+        self._flush_task = None
+        self._write_lock = asyncio.Lock()
+
+    async def get_user_data(self) -> dict:
+        return await self._load(USER_DATA)
+
+    async def get_chat_data(self) -> dict:
+        return await self._load(CHAT_DATA)
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        rows = await self.db.load_state(f"conversation:{name}")
+        return {tuple(json.loads(key)): json.loads(data) for key, data, _ in rows}
+
+    async def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        data = None if new_state is None else json.dumps(new_state)
+        self._queue((f"conversation:{name}", json.dumps(list(key))), data)
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._queue((USER_DATA, str(user_id)), json.dumps(data))
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._queue((CHAT_DATA, str(chat_id)), json.dumps(data))
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._queue((USER_DATA, str(user_id)), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._queue((CHAT_DATA, str(chat_id)), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._refresh((USER_DATA, str(user_id)), user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._refresh((CHAT_DATA, str(chat_id)), chat_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        """Bekleyen tüm yazmaları hemen veritabanına aktar"""
+        await self._write()
+
+    async def _load(self, kind: str) -> dict:
+        result = {}
+        for key, data, version in await self.db.load_state(kind):
+            self._versions[(kind, key)] = version
+            result[int(key)] = json.loads(data)
+        return result
+
+    async def _refresh(self, state_key: tuple, data: dict):
+        """Kayıt başka bir süreçte değiştiyse bellekteki sözlüğü güncelle"""
+        # Henüz yazılmamış yerel değişiklik en güncel olandır
+        if state_key in self._dirty:
+            return
+        row = await self.db.get_state(*state_key)
+        version = row[1] if row else None
+        if version == self._versions.get(state_key):
+            return
+        data.clear()
+        if row:
+            data.update(json.loads(row[0]))
+        self._versions[state_key] = version
+
+    def _queue(self, state_key: tuple, data):
+        """Yazmayı biriktir, kısa bir gecikmeyle toplu aktarımı planla"""
+        self._dirty[state_key] = data
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.flush_delay)
+        await self._write()
+
+    async def _write(self):
+        async with self._write_lock:
+            if not self._dirty:
+                return
+            batch, self._dirty = self._dirty, {}
+            version = time.time_ns()
+            try:
+                await self.db.save_state([
+                    (kind, key, data, version) for (kind, key), data in batch.items()
+                ])
+            except Exception as e:
+                logger.error(f"Bot durumu kaydedilemedi, tekrar denenecek: {str(e)}")
+                # Bu arada gelen daha yeni değişikliklerin üzerine yazma
+                for state_key, data in batch.items():
+                    self._dirty.setdefault(state_key, data)
+                if (self._flush_task is None or self._flush_task.done()
+                        or self._flush_task is asyncio.current_task()):
+                    self._flush_task = asyncio.create_task(self._delayed_flush())
+                return
+            for state_key, data in batch.items():
+                if data is None:
+                    self._versions.pop(state_key, None)
+                else:
+                    self._versions[state_key] = version
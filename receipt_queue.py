@@ -0,0 +1,148 @@
+import os
+import io
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from message_dispatcher import PRIORITY_NORMAL
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow kurulu değilse yalnızca dosya kimliğiyle eşleme yapılır
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram mesaj uzunluğu sınırının altında kalan özet parçası
+DIGEST_CHUNK_CHARS = 3500
+
+def image_hash(data: bytes) -> int:
+    """Görüntünün 64 bitlik fark karması (dHash); yeniden sıkıştırma ve boyutlandırmaya dayanıklıdır"""
+    with Image.open(io.BytesIO(data)) as image:
+        pixels = list(image.convert('L').resize((9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    # SQLite INTEGER işaretli 64 bittir
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+class ReceiptQueue:
+    """Banka havalesi dekontlarını veritabanında inceleme kuyruğunda tutar.
+
+    Her dekont Telegram file_unique_id değeriyle, Pillow kuruluysa görüntü
+    karmasıyla da indekslenir; daha önce gönderilmiş bir dekont eklenirken
+    indeksten bulunup tekrar olarak işaretlenir. Admin her dekont için ayrı
+    mesaj yerine periyodik bir özet alır.
+    """
+
+    def __init__(self, db, dispatcher, admin_id: str = None):
+        self.db = db
+        self.dispatcher = dispatcher
+        self.admin_id = admin_id or os.getenv('ADMIN_ID')
+        self.interval = int(os.getenv('RECEIPT_DIGEST_SECONDS', 600))
+        self.batch_size = int(os.getenv('RECEIPT_DIGEST_BATCH', 100))
+        self.hash_images = Image is not None and os.getenv('RECEIPT_IMAGE_HASH', '1') == '1'
+        self.hash_max_bytes = int(os.getenv('RECEIPT_HASH_MAX_BYTES', 5 * 1024 * 1024))
+        self._lock = asyncio.Lock()
+
+    def start(self, job_queue):
+        """Admin özetini gönderen işi başlat"""
+        job_queue.run_repeating(
+            self.send_digest,
+            interval=timedelta(seconds=self.interval),
+            first=timedelta(seconds=self.interval)
+        )
+
+    async def submit(self, bot, user_id: int, message) -> tuple:
+        """Mesajdaki dekontu kuyruğa ekle, (receipt_id, daha önceki aynı dekont) döndür"""
+        if message.photo:
+            media = message.photo[-1]
+            media_type = 'photo'
+            # Karma için en küçük boyut yeterlidir
+            hash_source = message.photo[0]
+        else:
+            media = message.document
+            media_type = 'document'
+            is_image = (media.mime_type or '').startswith('image/')
+            hash_source = media if is_image else None
+
+        receipt_hash = None
+        if self.hash_images and hash_source is not None:
+            receipt_hash = await self._hash(bot, hash_source)
+
+        receipt_id, original = await self.db.add_receipt(
+            user_id, media.file_id, media.file_unique_id, media_type, receipt_hash
+        )
+        if original:
+            logger.warning(
+                f"Tekrar gönderilen dekont - Dekont: #{receipt_id}, User ID: {user_id}, "
+                f"İlk dekont: #{original['id']}, İlk gönderen: {original['user_id']}"
+            )
+        return receipt_id, original
+
+    async def send_digest(self, context) -> int:
+        """Özete girmemiş dekontları admin'e toplu gönder (job queue callback'i)"""
+        if not self.admin_id or self._lock.locked():
+            return 0
+        async with self._lock:
+            sent = 0
+            while True:
+                # Dekontlar gönderimden önce sahiplenilir; birden fazla süreç aynı özeti göndermez
+                receipts = await self.db.claim_undigested_receipts(self.batch_size)
+                if not receipts:
+                    break
+                try:
+                    for text in self._format_digest(receipts):
+                        await self.dispatcher.send_message(self.admin_id, text, PRIORITY_NORMAL)
+                except Exception as e:
+                    logger.error(f"Dekont özeti gönderilemedi, sonraki turda tekrar denenecek: {str(e)}")
+                    await self.db.release_receipts([receipt['id'] for receipt in receipts])
+                    break
+                sent += len(receipts)
+                if len(receipts) < self.batch_size:
+                    break
+            if sent:
+                logger.info(f"Dekont özeti gönderildi - {sent} dekont")
+            return sent
+
+    async def _hash(self, bot, media):
+        """Görüntüyü indirip karmasını hesapla; başarısızsa None"""
+        if media.file_size and media.file_size > self.hash_max_bytes:
+            return None
+        try:
+            telegram_file = await bot.get_file(media.file_id)
+            data = bytes(await telegram_file.download_as_bytearray())
+            # Görüntü çözme event loop'u bloklamasın
+            return await asyncio.to_thread(image_hash, data)
+        except Exception as e:
+            logger.error(f"Dekont karması hesaplanamadı: {str(e)}")
+            return None
+
+    @staticmethod
+    def _format_digest(receipts: list) -> list:
+        """Özeti mesaj uzunluğu sınırına göre parçalara böl"""
+        duplicates = sum(1 for receipt in receipts if receipt['duplicate_of'])
+        header = f"💳 Yeni Dekontlar: {len(receipts)}"
+        if duplicates:
+            header += f" (⚠️ {duplicates} tekrar)"
+
+        chunks = []
+        current = header
+        for receipt in receipts:
+            entry = (
+                f"\n\n#{receipt['id']} - 👤 {receipt['user_id']} - "
+                f"{datetime.fromtimestamp(receipt['created_at']).strftime('%d.%m.%Y %H:%M')}"
+            )
+            if receipt['duplicate_of']:
+                entry += (
+                    f"\n⚠️ Tekrar: #{receipt['duplicate_of']} "
+                    f"(gönderen {receipt['original_user_id']}, durum: {receipt['original_status']})"
+                )
+            entry += f"\n/receipt {receipt['id']} | /approve_payment {receipt['user_id']}"
+            if len(current) + len(entry) > DIGEST_CHUNK_CHARS:
+                chunks.append(current)
+                current = entry.lstrip()
+            else:
+                current += entry
+        chunks.append(current)
+        return chunks
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from payment_processor import PAID_STATUSES, TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+class PaymentReconciler:
+    """Başlangıçta kesinleşmemiş ödemelerin durumunu toplu sorgulayıp takibi sürdürür.
+
+    Ödemeler veritabanından sayfa sayfa okunur, her sayfa sınırlı eşzamanlılıkla
+    sorgulanır. Değişen durumlar on_status ile işlenir, hâlâ açık olanlar
+    yeniden PaymentPoller takibine alınır.
+    """
+
+    def __init__(self, db, processor, poller, on_status, concurrency: int = None,
+                 page_size: int = None):
+        self.db = db
+        self.processor = processor
+        self.poller = poller
+        self.on_status = on_status  # async (bot, payment_id, status)
+        self.concurrency = concurrency or int(os.getenv('RECONCILE_CONCURRENCY', 10))
+        self.page_size = page_size or int(os.getenv('RECONCILE_PAGE_SIZE', 200))
+        self.max_age_seconds = int(os.getenv('RECONCILE_MAX_AGE_HOURS', 24)) * 3600
+
+    async def run(self, context) -> dict:
+        """Açık ödemeleri sayfa sayfa uzlaştır (job queue callback'i)"""
+        started = time.monotonic()
+        since = int(time.time()) - self.max_age_seconds
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {'checked': 0, 'settled': 0, 'tracked': 0, 'failed': 0}
+
+        async def reconcile(payment_id: str, created_at: int):
+            async with semaphore:
+                try:
+                    result = await self.processor.check_payment(payment_id)
+                    summary['checked'] += 1
+                    if not result.get('success'):
+                        # Geçici hata olabilir, takip sürdürülür
+                        summary['failed'] += 1
+                        self.poller.track(payment_id, created_at)
+                        return
+                    status = result.get('status')
+                    await self.on_status(context.bot, payment_id, status)
+                    if status in TERMINAL_STATUSES:
+                        summary['settled'] += 1
+                    else:
+                        self.poller.track(payment_id, created_at)
+                        summary['tracked'] += 1
+                except Exception as e:
+                    summary['failed'] += 1
+                    logger.error(f"Ödeme uzlaştırma hatası - Payment ID: {payment_id}, Hata: {str(e)}")
+
+        after = (0, '')
+        while True:
+            page = await self.db.get_unsettled_payments(
+                since, TERMINAL_STATUSES, after, self.page_size
+            )
+            if not page:
+                break
+            # NowPayments ödeme kimlikleri sayısaldır; manuel USDT kayıtları atlanır
+            await asyncio.gather(*(
+                reconcile(payment_id, created_at)
+                for payment_id, created_at in page
+                if payment_id.isdigit()
+            ))
+            after = (page[-1][1], page[-1][0])
+            if len(page) < self.page_size:
+                break
+
+        logger.info(
+            f"Ödeme uzlaştırma tamamlandı - Sorgulanan: {summary['checked']}, "
+            f"Kesinleşen: {summary['settled']}, Takibe alınan: {summary['tracked']}, "
+            f"Hatalı: {summary['failed']}, Süre: {time.monotonic() - started:.1f} sn"
+        )
+        return summary
+
+class PaymentListReconciler:
+    """NowPayments ödeme listesini son güncelleme zamanı imleciyle artımlı okuyup
+    yerel payments tablosunu toplu olarak eşitler.
+
+    Liste en son güncellenenden geriye doğru okunur ve imleçten eski kayda
+    gelindiğinde durulur; böylece her turda yalnızca değişen ödemeler çekilir.
+    Farklar tek işlemde uygulanır, yan etkiler on_changes ile işlenir.
+    """
+
+    def __init__(self, db, processor, on_changes, page_size: int = None,
+                 cursor_name: str = 'nowpayments_updated_at'):
+        self.db = db
+        self.processor = processor
+        self.on_changes = on_changes  # async (bot, [(payment_id, telegram_id, status, expire_date)])
+        self.page_size = page_size or int(os.getenv('LIST_RECONCILE_PAGE_SIZE', 100))
+        self.max_pages = int(os.getenv('LIST_RECONCILE_MAX_PAGES', 50))
+        self.max_age_seconds = int(os.getenv('RECONCILE_MAX_AGE_HOURS', 24)) * 3600
+        self.cursor_name = cursor_name
+        self._lock = asyncio.Lock()
+
+    async def run(self, context) -> dict:
+        """Son turdan beri değişen ödemeleri uygula (job queue callback'i)"""
+        if self._lock.locked():
+            return {}
+        async with self._lock:
+            cursor = await self.db.get_sync_cursor(self.cursor_name)
+            # NowPayments dateFrom oluşturma tarihine göre süzer
+            date_from = datetime.fromtimestamp(time.time() - self.max_age_seconds).strftime('%Y-%m-%d')
+            newest = cursor
+            statuses = {}
+            pages = 0
+            
+            complete = False
+            while not complete and pages < self.max_pages:
+                result = await self.processor.list_payments(pages, self.page_size, date_from)
+                if not result.get('success'):
+                    logger.warning(f"Ödeme listesi alınamadı, imleç ilerletilmedi: {result.get('error')}")
+                    return {}
+                pages += 1
+                
+                for item in result['payments']:
+                    updated_at = item.get('updated_at') or ''
+                    # Aynı zamandaki kayıtlar tekrar işlenebilir, fark yoksa yazılmaz
+                    if cursor and updated_at < cursor:
+                        complete = True
+                        break
+                    statuses.setdefault(str(item['payment_id']), item.get('payment_status'))
+                    newest = max(newest or '', updated_at)
+                
+                if pages >= result['pages']:
+                    complete = True
+            
+            changes = []
+            if statuses:
+                changes = await self.db.apply_payment_statuses(
+                    list(statuses.items()), PAID_STATUSES, int(time.time())
+                )
+                if changes:
+                    await self.on_changes(context.bot, changes)
+            # Okunamayan eski sayfalar kalmışsa imleç ilerletilmez, sonraki turda tekrar denenir
+            if not complete:
+                logger.warning(f"Ödeme listesi {pages} sayfada tamamlanamadı, imleç ilerletilmedi")
+            elif newest and newest != cursor:
+                await self.db.set_sync_cursor(self.cursor_name, newest)
+            
+            summary = {'pages': pages, 'seen': len(statuses), 'changed': len(changes)}
+            logger.info(
+                f"Ödeme listesi eşitlendi - Sayfa: {pages}, Görülen: {summary['seen']}, "
+                f"Değişen: {summary['changed']}"
+            )
+            return summary
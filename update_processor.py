@@ -0,0 +1,59 @@
+import os
+import asyncio
+import logging
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Güncellemeleri sınırlı sayıda işçiyle eşzamanlı, aynı sohbet içinde sırayla işler.
+
+    Her sohbetin son güncellemesi bir Event ile izlenir; yeni güncelleme öncekinin
+    bitmesini bekler ve bu bekleme işçi kotası harcamaz. Böylece yavaş bir
+    sohbet yalnızca kendi sırasını tutar, diğer sohbetler işlenmeye devam eder.
+    """
+
+    def __init__(self, workers: int = None, max_pending: int = None):
+        # Üst sınıfın semaforu bekleyenler dahil toplam güncelleme sayısını sınırlar
+        super().__init__(max_pending or int(os.getenv('UPDATE_MAX_PENDING', 256)))
+        self.workers = workers or int(os.getenv('UPDATE_WORKERS', 8))
+        self._worker_slots = None
+        self._tails = {}  # chat_id -> son güncellemenin bitişini bildiren Event
+
+    async def initialize(self) -> None:
+        self._worker_slots = asyncio.Semaphore(self.workers)
+
+    async def shutdown(self) -> None:
+        self._tails.clear()
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = self._chat_key(update)
+        previous = self._tails.get(key) if key is not None else None
+        done = asyncio.Event()
+        if key is not None:
+            self._tails[key] = done
+
+        try:
+            if previous is not None:
+                await previous.wait()
+            async with self._worker_slots:
+                await coroutine
+        finally:
+            done.set()
+            if key is not None and self._tails.get(key) is done:
+                del self._tails[key]
+
+    @staticmethod
+    def _chat_key(update: object):
+        """Sıranın korunacağı sohbet (yoksa kullanıcı) kimliği"""
+        if not isinstance(update, Update):
+            return None
+        # Katılma isteklerinin sohbeti gruptur; tek sıraya girmesinler diye kullanıcıya göre sıralanır
+        if update.chat_join_request is not None:
+            return update.chat_join_request.from_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None